@@ -8,14 +8,16 @@ package.domain = org.jerry
 # (str) Source code directory
 source.dir = .
 # (list) Source file extensions to include
-source.include_exts = py,png,jpg,kv,atlas,wav,json,txt,env
+source.include_exts = py,png,jpg,kv,atlas,wav,json,txt,env,bin
 source.include_patterns = .env
+# (list) Development tools and tests that stay out of the APK
+source.exclude_dirs = tools, tests
 # (str) Application versioning
 version = 0.1
 # (list) List of modules to bundle with your application
 # Removed google-generativeai and google-api-python-client as they don't work with p4a
 # Added certifi for SSL certificate handling
-requirements = python3,kivy,kivymd,pillow,pyjnius,android,openssl,sqlite3,requests,urllib3,tqdm,certifi,openai,typing_extensions,pydantic,httpx,anyio,sniffio,charset_normalizer,distro,python-dotenv,idna
+requirements = python3,kivy,kivymd,pillow,numpy,pyjnius,android,openssl,sqlite3,requests,urllib3,tqdm,certifi,openai,typing_extensions,pydantic,httpx,anyio,sniffio,charset_normalizer,distro,python-dotenv,idna
 # (str) Icon of the application
 icon.filename = %(source.dir)s/assets/JerryIcon.png
 # (str) Supported orientation
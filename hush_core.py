@@ -0,0 +1,3469 @@
+#!/usr/bin/env python3
+"""
+hush_core.py — Hush's storage, chat pipeline and companion logic, without the UI
+
+Nothing here opens a Kivy window, so the development tools in tools/ and the
+tests can import it headlessly. main.py builds the app's screens on top of it.
+"""
+
+import os
+import time
+import threading
+import math
+import json
+import gzip
+import lzma
+import copy
+import queue
+import random
+import hashlib
+import heapq
+import asyncio
+import mmap
+import re
+import sqlite3
+import struct
+import tempfile
+import openai
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+# Kivy's Clock hands results back to the UI thread. Without Kivy (tools, tests)
+# there is no UI thread and call_on_ui runs them inline.
+try:
+    from kivy.clock import Clock
+except ImportError:
+    Clock = None
+
+# numpy is only needed for MoodAnalytics; the rest of the app runs without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# httpx powers AsyncChatClient; without it JerryAI falls back to the openai module
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# --- PATHS & BASIC SETUP ---
+ASSETS_PATH = "assets"
+
+# --- GLOBAL DATA ---
+AFFIRMATIONS = [
+    "Your feelings are valid, even the difficult ones.", "Be kind and patient with yourself today.",
+    "Each breath is a new, gentle beginning.", "It's okay to rest; you are doing enough.",
+    "You are resilient, and you can get through this moment.", "Allow yourself to simply be, without judgment."
+]
+PLAYLIST = ["01 Morning Dew.wav", "02 Serenity.wav", "04 Enchanting Table.wav", "06 Moving On.wav", "13 Return Home.wav"]
+
+CBT_QUESTIONS = [
+    {"question": "What was the situation or event that triggered the difficult feeling?", "key": "situation", "hint": "e.g., I had a disagreement with a friend."},
+    {"question": "What emotions did you feel? (e.g., sad, angry, anxious)", "key": "emotions", "hint": "List the primary emotions."},
+    {"question": "What were the automatic thoughts that went through your mind?", "key": "thoughts", "hint": "What did you immediately think or believe?"}
+]
+COGNITIVE_DISTORTIONS = {
+    "All-or-Nothing Thinking": "Viewing things in black-and-white categories.", "Overgeneralization": "Seeing a single negative event as a never-ending pattern of defeat.",
+    "Mental Filter": "Picking out a single negative detail and dwelling on it exclusively.", "Disqualifying the Positive": "Rejecting positive experiences by insisting they 'don't count'.",
+    "Jumping to Conclusions": "Making a negative interpretation despite no definite facts.", "Mind Reading": "Concluding that someone is reacting negatively to you without evidence.",
+    "Fortune Telling": "Anticipating that things will turn out badly.", "Magnification/Minimization": "Exaggerating the importance of negative things or shrinking positive things.",
+    "Emotional Reasoning": "Assuming that your negative emotions necessarily reflect the way things really are.", "Should Statements": "Motivating yourself with 'shoulds' and 'shouldn'ts'.",
+    "Labeling": "An extreme form of overgeneralization; attaching a negative label to yourself.", "Personalization": "Seeing yourself as the cause of some negative external event which you were not responsible for."
+}
+DBT_QUESTIONS = [
+    {"question": "Rate the intensity of your ANGER (0-5).", "key": "anger", "type": "rating"}, {"question": "Rate the intensity of your SADNESS (0-5).", "key": "sadness", "type": "rating"},
+    {"question": "Rate the intensity of your FEAR (0-5).", "key": "fear", "type": "rating"}, {"question": "Rate the intensity of your SHAME (0-5).", "key": "shame", "type": "rating"},
+    {"question": "Rate your urge for self-harm (0-5).", "key": "self_harm_urge", "type": "rating"}, {"question": "Rate your urge to use substances (0-5).", "key": "substance_urge", "type": "rating"},
+]
+CHECKIN_STEPS = [
+    ("How are you feeling emotionally?", ["Good", "Okay", "Bad"], "emotion"),
+    ("How is your body feeling?", ["Energetic", "Tired", "Pain"], "physical"),
+    ("How is your mind today?", ["Clear", "Foggy", "Overwhelmed"], "mental")
+]
+DBT_SKILLS = {
+    "Mindfulness": ["Observe", "Describe", "Participate", "Non-judgmentally", "One-mindfully", "Effectively"], "Distress Tolerance": ["TIP", "ACCEPTS", "Self-Soothe", "IMPROVE the moment", "Radical Acceptance"],
+    "Emotion Regulation": ["Check the Facts", "Opposite Action", "Problem Solving", "ABC PLEASE"], "Interpersonal Effectiveness": ["DEAR MAN", "GIVE", "FAST"]
+}
+# Phrases that should prompt a check-in with crisis resources. Matched on whole
+# words after lowercasing, dropping apostrophes and collapsing punctuation.
+RISK_PHRASES = {
+    "high": [
+        "kill myself", "killing myself", "kms", "end my life", "ending my life", "end it all", "take my own life",
+        "suicide", "suicidal", "want to die", "wanna die", "wish i was dead", "wish i were dead", "better off dead",
+        "no reason to live", "dont want to live", "dont want to be alive", "hang myself", "overdose", "od on",
+        "not be here anymore", "say goodbye to everyone",
+    ],
+    "moderate": [
+        "hurt myself", "hurting myself", "self harm", "selfharm", "self harming", "cut myself", "cutting myself",
+        "burn myself", "starve myself", "cant go on", "cant do this anymore", "no way out", "hopeless",
+        "worthless", "nobody would miss me", "no one would miss me", "everyone would be better off without me",
+        "give up on life", "want to disappear", "hate being alive",
+    ],
+}
+RISK_LEVELS = ("moderate", "high")
+
+def call_on_ui(fn):
+    if Clock is None:
+        fn()
+    else:
+        Clock.schedule_once(lambda dt: fn())
+
+def atomic_write_json(filepath, obj, indent=None):
+    # Write to a sibling temp file and rename over the target so a crash
+    # mid-write never leaves a truncated JSON file behind.
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+class PersistenceWriter:
+    # Single background thread that performs all store writes. Stores take a
+    # snapshot on the calling thread and submit a write job; one worker drains
+    # a bounded FIFO, so writes to any given file land in submission order.
+    MAX_PENDING = 256
+
+    def __init__(self, max_pending=None):
+        self.queue = queue.Queue(maxsize=max_pending or self.MAX_PENDING)
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="PersistenceWriter", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            label, job = self.queue.get()
+            try:
+                job()
+                if label is not None:
+                    self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[PersistenceWriter] Error writing {label}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def submit(self, label, job):
+        # Blocks only if MAX_PENDING writes are already queued (backpressure).
+        self._ensure_started()
+        self.queue.put((label, job))
+
+    def flush(self, timeout=5.0):
+        """Wait until every write submitted so far has been performed."""
+        if self.thread is None or not self.thread.is_alive():
+            return True
+        barrier = threading.Event()
+        self.queue.put((None, barrier.set))
+        done = barrier.wait(timeout)
+        if not done:
+            print("[PersistenceWriter] flush timed out with writes still pending.")
+        return done
+
+persistence_writer = PersistenceWriter()
+
+class CoalescingJSONStore:
+    # Dirty-tracking persistence for small state files. save() only marks the
+    # store dirty; the snapshot is taken once the debounce window closes (or on
+    # flush()) and handed to the PersistenceWriter, so bursts of saves collapse
+    # into a single background write. save() may be called from worker threads:
+    # the dirty state is guarded by a lock and Kivy's Clock accepts schedules
+    # from any thread (the flush itself then runs on the UI thread).
+    DEBOUNCE_SECONDS = 0.5
+
+    def __init__(self, filepath, snapshot_fn, debounce=None, indent=4, writer=None):
+        self.filepath = filepath
+        self.writer = writer or persistence_writer
+        self.snapshot_fn = snapshot_fn
+        self.debounce = self.DEBOUNCE_SECONDS if debounce is None else debounce
+        self.indent = indent
+        self.dirty = False
+        self.flush_event = None
+        self.lock = threading.RLock()
+        self.save_requests = 0
+        self.writes = 0
+
+    def save(self):
+        with self.lock:
+            self.save_requests += 1
+            self.dirty = True
+            if self.flush_event is None:
+                try:
+                    self.flush_event = Clock.schedule_once(self._scheduled_flush, self.debounce)
+                except Exception:
+                    self.flush()
+
+    def _scheduled_flush(self, dt):
+        with self.lock:
+            self.flush_event = None
+            self.flush()
+
+    def _cancel_flush(self):
+        # caller holds the lock
+        if self.flush_event is not None:
+            try:
+                self.flush_event.cancel()
+            except Exception:
+                pass
+            self.flush_event = None
+
+    def flush(self):
+        with self.lock:
+            self._cancel_flush()
+            if not self.dirty:
+                return False
+            self.dirty = False
+            try:
+                snapshot = self.snapshot_fn()
+                self.writer.submit(
+                    os.path.basename(self.filepath),
+                    lambda: atomic_write_json(self.filepath, snapshot, indent=self.indent),
+                )
+                self.writes += 1
+                return True
+            except Exception as e:
+                self.dirty = True
+                print(f"[CoalescingJSONStore] Error writing {os.path.basename(self.filepath)}: {e}")
+                return False
+
+    def discard(self):
+        # drops unsaved changes without writing them
+        with self.lock:
+            self._cancel_flush()
+            self.dirty = False
+
+    @property
+    def coalesced_writes(self):
+        # saves that were merged into another write instead of hitting disk
+        return max(0, self.save_requests - self.writes - (1 if self.dirty else 0))
+
+    def stats(self):
+        return {
+            "file": os.path.basename(self.filepath),
+            "save_requests": self.save_requests,
+            "writes": self.writes,
+            "coalesced_writes": self.coalesced_writes,
+            "dirty": self.dirty,
+        }
+
+class ConversationLog:
+    # Sessions are appended as JSON Lines to rotating segment files under
+    # "<name>_segments/", listed oldest-first in a small manifest.json.
+    # Newest-first reads walk the segments (and their lines) backwards.
+    # The active segment rolls over at SEGMENT_MAX_BYTES or once the session
+    # being appended is SEGMENT_MAX_DAYS newer than its first one. Segments whose newest session is older
+    # than ARCHIVE_AFTER_DAYS (the active one included) are compressed into
+    # cold archive blocks; the manifest keeps a block index (timestamp range +
+    # count) so a lookup only decompresses the block it needs.
+    SEGMENT_MAX_BYTES = 256 * 1024
+    SEGMENT_MAX_DAYS = 7
+    MANIFEST_NAME = "manifest.json"
+    ARCHIVE_AFTER_DAYS = 30
+    ARCHIVE_CODEC = "gzip"  # or "lzma": smaller blocks, slower to compress
+    ARCHIVE_CODECS = {"gzip": (gzip, ".jsonl.gz"), "lzma": (lzma, ".jsonl.xz")}
+
+    def __init__(self, filepath, archive_after_days=None, archive_codec=None, search_index=None, retriever=None):
+        self.filepath = filepath
+        self.search_index = search_index
+        self.retriever = retriever
+        self.segment_dir = os.path.splitext(filepath)[0] + "_segments"
+        self.manifest_path = self.manifest_path_for(filepath)
+        self.archive_after_days = self.ARCHIVE_AFTER_DAYS if archive_after_days is None else archive_after_days
+        self.archive_codec = archive_codec or self.ARCHIVE_CODEC
+        self.lock = threading.Lock()
+        self.manifest = self.load_manifest_file(self.manifest_path)
+        self.active_started = (None, None)
+        self._migrate_legacy_log()
+        if self.search_index:
+            self.search_index.register_source("conversation", self.iter_index_docs)
+        if self.retriever:
+            self.retriever.register_source(self.iter_sessions_chronological)
+        persistence_writer.submit("conversation archive", self.archive_old_sessions)
+
+    @classmethod
+    def manifest_path_for(cls, filepath):
+        return os.path.join(os.path.splitext(filepath)[0] + "_segments", cls.MANIFEST_NAME)
+
+    @staticmethod
+    def load_manifest_file(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+                if isinstance(manifest.get("segments"), list):
+                    manifest.setdefault("archive", [])
+                    return manifest
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        except Exception as e:
+            print(f"[ConversationLog] Error loading manifest: {e}")
+        return {"version": 1, "segments": [], "archive": []}
+
+    def _save_manifest(self):
+        try:
+            os.makedirs(self.segment_dir, exist_ok=True)
+            atomic_write_json(self.manifest_path, self.manifest)
+        except Exception as e:
+            print(f"[ConversationLog] Error saving manifest: {e}")
+
+    def _segment_path(self, name):
+        return os.path.join(self.segment_dir, name)
+
+    def _next_segment_name(self):
+        # archived segments leave the list, so numbering comes from a counter
+        index = self.manifest.get("next_segment", len(self.manifest["segments"]))
+        self.manifest["next_segment"] = index + 1
+        return f"segment_{index:06d}.jsonl"
+
+    def _new_segment(self):
+        name = self._next_segment_name()
+        self.manifest["segments"].append(name)
+        self._save_manifest()
+        return name
+
+    def _active_segment(self, timestamp=None):
+        segments = self.manifest["segments"]
+        if not segments:
+            return self._new_segment()
+        name = segments[-1]
+        try:
+            if os.path.getsize(self._segment_path(name)) >= self.SEGMENT_MAX_BYTES:
+                return self._new_segment()
+            if self._spans_too_long(self._segment_started(name), timestamp):
+                return self._new_segment()
+        except OSError:
+            pass
+        return name
+
+    @classmethod
+    def _spans_too_long(cls, started, timestamp):
+        # True if a session at timestamp is SEGMENT_MAX_DAYS past a segment's first one
+        if not started or not timestamp:
+            return False
+        try:
+            appended = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return False
+        return started < (appended - timedelta(days=cls.SEGMENT_MAX_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _segment_started(self, name):
+        # timestamp of the segment's first session (None while empty), cached per segment
+        if self.active_started[0] != name:
+            with open(self._segment_path(name), 'rb') as f:
+                first = next(self._parse_lines([f.readline()]), None)
+            if first is None:
+                return None
+            self.active_started = (name, first.get("timestamp", ""))
+        return self.active_started[1]
+
+    def _append_record(self, session):
+        line = json.dumps(session, separators=(',', ':')) + "\n"
+        os.makedirs(self.segment_dir, exist_ok=True)
+        with open(self._segment_path(self._active_segment(session.get("timestamp"))), 'a') as f:
+            f.write(line)
+
+    def _migrate_legacy_log(self):
+        # One-time import of the old single-file format (a JSON list, newest first).
+        # Sessions go into fresh segment files that only join the log when the
+        # manifest listing them is written, so a crash part-way leaves either
+        # nothing imported or everything; the old file is renamed last.
+        if not os.path.exists(self.filepath):
+            return
+        if self.manifest["segments"]:
+            # already imported; a crash kept the old file from being renamed
+            try:
+                os.replace(self.filepath, self.filepath + ".migrated")
+            except OSError as e:
+                print(f"[ConversationLog] Error renaming legacy log: {e}")
+            return
+        try:
+            with open(self.filepath, 'r') as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            legacy = []
+        except Exception as e:
+            print(f"[ConversationLog] Error reading legacy log: {e}")
+            return
+
+        try:
+            sessions = [s for s in reversed(legacy if isinstance(legacy, list) else []) if isinstance(s, dict)]
+            names = self._write_segments(sessions)
+            with self.lock:
+                manifest = dict(self.manifest, segments=names)
+                atomic_write_json(self.manifest_path, manifest)
+                self.manifest = manifest
+            os.replace(self.filepath, self.filepath + ".migrated")
+            if self.search_index:
+                self.search_index.mark_stale()
+            if self.retriever:
+                self.retriever.mark_stale()
+            print(f"[ConversationLog] Migrated {len(sessions)} sessions to segmented log.")
+        except Exception as e:
+            print(f"[ConversationLog] Error migrating legacy log: {e}")
+
+    @staticmethod
+    def _read_lines_reversed(path, block_size=8192):
+        # Yields complete lines from the end of the file towards the start.
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                remainder = b""
+                while position > 0:
+                    read_size = min(block_size, position)
+                    position -= read_size
+                    f.seek(position)
+                    chunk = f.read(read_size) + remainder
+                    lines = chunk.split(b"\n")
+                    remainder = lines.pop(0)
+                    for line in reversed(lines):
+                        if line.strip():
+                            yield line
+                if remainder.strip():
+                    yield remainder
+        except FileNotFoundError:
+            return
+
+    @staticmethod
+    def _parse_lines(lines):
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # a torn final line from an interrupted write; skip it
+                continue
+
+    def _read_archive_block(self, block):
+        # Decompresses one cold block and returns its sessions newest first.
+        codec = self.ARCHIVE_CODECS.get(block.get("codec"), self.ARCHIVE_CODECS["gzip"])[0]
+        try:
+            with codec.open(self._segment_path(block["name"]), 'rb') as f:
+                lines = f.read().split(b"\n")
+        except FileNotFoundError:
+            return []
+        return list(self._parse_lines(line for line in reversed(lines) if line.strip()))
+
+    def _snapshot_layout(self):
+        with self.lock:
+            return list(self.manifest["segments"]), list(self.manifest["archive"])
+
+    def iter_sessions(self):
+        """Yield stored sessions newest first without loading the whole log."""
+        segments, archive = self._snapshot_layout()
+        for name in reversed(segments):
+            yield from self._parse_lines(self._read_lines_reversed(self._segment_path(name)))
+        for block in reversed(archive):
+            yield from self._read_archive_block(block)
+
+    def iter_sessions_chronological(self):
+        """Yield sessions oldest first, streaming line by line (used by export)."""
+        return self._iter_layout_chronological(*self._snapshot_layout())
+
+    def _iter_layout_chronological(self, segments, archive):
+        for block in archive:
+            codec = self.ARCHIVE_CODECS.get(block.get("codec"), self.ARCHIVE_CODECS["gzip"])[0]
+            try:
+                with codec.open(self._segment_path(block["name"]), 'rb') as f:
+                    yield from self._parse_lines(line for line in f if line.strip())
+            except FileNotFoundError:
+                continue
+        for name in segments:
+            try:
+                with open(self._segment_path(name), 'rb') as f:
+                    yield from self._parse_lines(line for line in f if line.strip())
+            except FileNotFoundError:
+                continue
+
+    @staticmethod
+    def session_key(session):
+        # identifies a session across exports: same timestamp and same messages
+        raw = json.dumps([session.get("timestamp", ""), session.get("conversation")], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(raw.encode('utf-8')).digest()
+
+    def import_sessions(self, spool_path):
+        """Merge the sessions in an NDJSON file into the log by timestamp.
+
+        Sessions already stored are skipped. The merge runs on the persistence
+        writer; the returned Future resolves to the number of sessions added.
+        """
+        future = Future()
+
+        def job():
+            try:
+                future.set_result(self._merge_import(spool_path))
+            except Exception as e:
+                print(f"[ConversationLog] Error importing sessions: {e}")
+                future.set_exception(e)
+        persistence_writer.submit("conversation import", job)
+        return future
+
+    def _merge_import(self, spool_path):
+        # Runs on the writer thread, so no other write can interleave. Reads the
+        # stored keys once, then either appends (everything imported is newer)
+        # or rewrites the log as one time-ordered merge and re-archives it.
+        segments, archive = self._snapshot_layout()
+        seen, newest = set(), ""
+        for session in self._iter_layout_chronological(segments, archive):
+            seen.add(self.session_key(session))
+            newest = max(newest, session.get("timestamp", ""))
+
+        # (timestamp, offset) of each new session in the spool, sorted by time
+        pending = []
+        with open(spool_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    session = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    session = None
+                if isinstance(session, dict) and session.get("conversation"):
+                    key = self.session_key(session)
+                    if key not in seen:
+                        seen.add(key)
+                        pending.append((session.get("timestamp", ""), offset))
+                offset += len(line)
+        if not pending:
+            return 0
+        pending.sort()
+
+        def imported():
+            with open(spool_path, 'rb') as f:
+                for _, offset in pending:
+                    f.seek(offset)
+                    session = json.loads(f.readline())
+                    yield {"timestamp": session.get("timestamp", ""), "conversation": session["conversation"]}
+
+        if pending[0][0] >= newest:
+            for session in imported():
+                self._write_session(session)
+            return len(pending)
+
+        merged = heapq.merge(
+            self._iter_layout_chronological(segments, archive), imported(),
+            key=lambda s: s.get("timestamp", ""),
+        )
+        names = self._write_segments(merged)
+        with self.lock:
+            self.manifest["segments"] = names
+            self.manifest["archive"] = []
+            self._save_manifest()
+        for name in segments + [block["name"] for block in archive]:
+            try:
+                os.remove(self._segment_path(name))
+            except FileNotFoundError:
+                pass
+        self.archive_old_sessions()
+        if self.search_index:
+            self.search_index.mark_stale()
+        if self.retriever:
+            self.retriever.mark_stale()
+        print(f"[ConversationLog] Merged {len(pending)} imported sessions into the log.")
+        return len(pending)
+
+    def _write_segments(self, sessions):
+        # writes a chronological stream into fresh segment files, returning their names
+        os.makedirs(self.segment_dir, exist_ok=True)
+        names, f, size, started = [], None, 0, None
+        try:
+            for session in sessions:
+                line = (json.dumps(session, separators=(',', ':')) + "\n").encode('utf-8')
+                timestamp = session.get("timestamp", "")
+                if f is None or size >= self.SEGMENT_MAX_BYTES or self._spans_too_long(started, timestamp):
+                    if f is not None:
+                        f.close()
+                    with self.lock:
+                        names.append(self._next_segment_name())
+                    f = open(self._segment_path(names[-1]), 'wb')
+                    size, started = 0, timestamp
+                f.write(line)
+                size += len(line)
+            if f is None:
+                with self.lock:
+                    names.append(self._next_segment_name())
+                open(self._segment_path(names[-1]), 'wb').close()
+        finally:
+            if f is not None:
+                f.close()
+        return names
+
+    def load_sessions_between(self, start, end):
+        """Sessions with start <= timestamp <= end, newest first.
+
+        Cold blocks outside the range (per the block index) are never opened.
+        """
+        segments, archive = self._snapshot_layout()
+        results = []
+        for name in reversed(segments):
+            for session in self._parse_lines(self._read_lines_reversed(self._segment_path(name))):
+                timestamp = session.get("timestamp", "")
+                if timestamp < start:
+                    return results
+                if timestamp <= end:
+                    results.append(session)
+        for block in reversed(archive):
+            if block["last_timestamp"] < start:
+                break
+            if block["first_timestamp"] > end:
+                continue
+            results.extend(
+                s for s in self._read_archive_block(block)
+                if start <= s.get("timestamp", "") <= end
+            )
+        return results
+
+    def archive_old_sessions(self):
+        """Compress full segments older than the archive age into cold blocks."""
+        if self.archive_after_days is None or self.archive_after_days < 0:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=self.archive_after_days)).strftime("%Y-%m-%d %H:%M:%S")
+        codec, suffix = self.ARCHIVE_CODECS.get(self.archive_codec, self.ARCHIVE_CODECS["gzip"])
+        archived = 0
+        try:
+            with self.lock:
+                # the active segment goes too once its newest session is old
+                # enough; the next append then starts a fresh one
+                while self.manifest["segments"]:
+                    name = self.manifest["segments"][0]
+                    path = self._segment_path(name)
+                    try:
+                        with open(path, 'rb') as f:
+                            raw = f.read()
+                    except FileNotFoundError:
+                        raw = b""
+                    sessions = list(self._parse_lines(l for l in raw.split(b"\n") if l.strip()))
+                    if sessions and sessions[-1].get("timestamp", "") >= cutoff:
+                        break
+                    if not sessions and len(self.manifest["segments"]) == 1:
+                        break
+
+                    block_name = os.path.splitext(name)[0] + suffix
+                    if sessions:
+                        with codec.open(self._segment_path(block_name) + ".tmp", 'wb') as f:
+                            f.write(raw)
+                        os.replace(self._segment_path(block_name) + ".tmp", self._segment_path(block_name))
+                        self.manifest["archive"].append({
+                            "name": block_name,
+                            "codec": self.archive_codec,
+                            "count": len(sessions),
+                            "first_timestamp": sessions[0].get("timestamp", ""),
+                            "last_timestamp": sessions[-1].get("timestamp", ""),
+                        })
+                    self.manifest["segments"].pop(0)
+                    self._save_manifest()
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    archived += len(sessions)
+        except Exception as e:
+            print(f"[ConversationLog] Error archiving sessions: {e}")
+        if archived:
+            print(f"[ConversationLog] Archived {archived} sessions to cold storage.")
+        return archived
+
+    def load_log(self):
+        try:
+            return list(self.iter_sessions())
+        except Exception as e:
+            print(f"[ConversationLog] Error loading log: {e}")
+            return []
+
+    def add_session(self, chat_history):
+        if not chat_history:
+            return
+        session = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "conversation": copy.deepcopy(chat_history)}
+        persistence_writer.submit("conversation session", lambda: self._write_session(session))
+
+    def _write_session(self, session):
+        try:
+            with self.lock:
+                self._append_record(session)
+        except Exception as e:
+            print(f"[ConversationLog] Error saving log: {e}")
+            return
+        if self.search_index:
+            self.search_index.add_document(
+                "conversation", session["timestamp"], session["timestamp"], SearchIndex.session_text(session)
+            )
+        if self.retriever:
+            self.retriever.add_session(session)
+
+    def open_pager(self, page_size=None):
+        return ConversationPager(self, page_size)
+
+    def iter_index_docs(self):
+        for session in self.iter_sessions():
+            timestamp = session.get("timestamp", "")
+            yield timestamp, timestamp, SearchIndex.session_text(session)
+
+class ConversationPager:
+    # Newest-first, page-at-a-time reader over a ConversationLog. Hot segments
+    # are memory-mapped and scanned backwards only as far as the pages asked
+    # for; each session found is recorded in an offset index so earlier pages
+    # can be re-read without scanning again. Cold blocks are decompressed only
+    # when paging reaches them. Opening costs the same for any history size.
+    PAGE_SIZE = 20
+
+    def __init__(self, conversation_log, page_size=None):
+        self.log = conversation_log
+        self.page_size = page_size or self.PAGE_SIZE
+        self.segments, self.archive = conversation_log._snapshot_layout()
+        # sources newest first: ("segment", name) or ("block", index entry)
+        self.sources = [("segment", name) for name in reversed(self.segments)] + \
+                       [("block", block) for block in reversed(self.archive)]
+        self.index = []  # (source_position, start, end) for segments, (source_position, i, None) for blocks
+        self.source_position = 0
+        self.scan_end = None
+        self.files = {}
+        self.maps = {}
+        self.block_cache = (None, [])
+        self.next_page_number = 0
+
+    def _mmap(self, name):
+        if name not in self.maps:
+            try:
+                f = open(self.log._segment_path(name), 'rb')
+                self.files[name] = f
+                self.maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # missing or empty segment file
+                self.maps[name] = None
+        return self.maps[name]
+
+    def _block_sessions(self, position):
+        if self.block_cache[0] != position:
+            self.block_cache = (position, self.log._read_archive_block(self.sources[position][1]))
+        return self.block_cache[1]
+
+    def _index_one(self):
+        # Extends the offset index by one session; False once history is exhausted.
+        while self.source_position < len(self.sources):
+            kind, source = self.sources[self.source_position]
+            if kind == "segment":
+                mm = self._mmap(source)
+                end = len(mm) if (mm is not None and self.scan_end is None) else (self.scan_end or 0)
+                while end > 0 and mm[end - 1:end] == b"\n":
+                    end -= 1
+                if end > 0:
+                    start = mm.rfind(b"\n", 0, end) + 1
+                    self.scan_end = start
+                    self.index.append((self.source_position, start, end))
+                    return True
+            else:
+                sessions = self._block_sessions(self.source_position)
+                i = 0 if self.scan_end is None else self.scan_end
+                if i < len(sessions):
+                    self.scan_end = i + 1
+                    self.index.append((self.source_position, i, None))
+                    return True
+            self.source_position += 1
+            self.scan_end = None
+        return False
+
+    def _read(self, entry):
+        position, start, end = entry
+        kind, source = self.sources[position]
+        if kind == "block":
+            return self._block_sessions(position)[start]
+        try:
+            return json.loads(self._mmap(source)[start:end])
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def page(self, page_number):
+        """Sessions on the given page (0 = newest); [] past the end."""
+        wanted = (page_number + 1) * self.page_size
+        while len(self.index) < wanted and self._index_one():
+            pass
+        sessions = (self._read(e) for e in self.index[page_number * self.page_size:wanted])
+        return [s for s in sessions if s is not None]
+
+    def next_page(self):
+        sessions = self.page(self.next_page_number)
+        if sessions:
+            self.next_page_number += 1
+        return sessions
+
+    @property
+    def has_more(self):
+        return len(self.index) > self.next_page_number * self.page_size or self._index_one()
+
+    def close(self):
+        for mm in self.maps.values():
+            if mm is not None:
+                mm.close()
+        for f in self.files.values():
+            f.close()
+        self.maps, self.files = {}, {}
+
+class JerryMemory:
+    def __init__(self, filepath, memory=None):
+        self.filepath = filepath
+        # last known contents; seeded from the startup snapshot when available
+        self.cache = copy.deepcopy(dict(memory)) if memory is not None else None
+
+    def load_memory(self):
+        if self.cache is not None:
+            return copy.deepcopy(self.cache)
+        try:
+            with open(self.filepath, 'r') as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.cache = {}
+        return copy.deepcopy(self.cache)
+
+    def save_memory(self, memory_dict):
+        snapshot = copy.deepcopy(memory_dict)
+        self.cache = copy.deepcopy(snapshot)
+        persistence_writer.submit("jerry memory", lambda: self._write_memory(snapshot))
+
+    def _write_memory(self, memory_dict):
+        try:
+            atomic_write_json(self.filepath, memory_dict, indent=4)
+        except Exception as e:
+            print(f"[JerryMemory] Error saving memory: {e}")
+
+class EntriesLog:
+    # Entries live in a SQLite database next to the old entries.json, indexed by
+    # timestamp and type, so startup and add_entry don't scale with history size.
+    # Inserts run on the PersistenceWriter thread. An entry is identified by its
+    # timestamp, type and a hash of its normalised data (unique index), so
+    # importing the same export twice adds nothing the second time.
+    PAGE_SIZE = 50
+
+    def __init__(self, entries_filepath, search_index=None):
+        self.filepath = entries_filepath
+        self.db_path = os.path.splitext(entries_filepath)[0] + ".db"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.search_index = search_index
+        self._create_schema()
+        self._migrate_legacy_entries()
+        if self.search_index:
+            self.search_index.register_source("entry", self.iter_index_docs)
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "timestamp TEXT NOT NULL, "
+                "type TEXT NOT NULL, "
+                "data TEXT NOT NULL, "
+                "data_hash TEXT)"
+            )
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+            removed = 0
+            if "data_hash" not in columns:
+                removed = self._add_data_hashes()
+            self.conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_identity ON entries (timestamp, type, data_hash)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (timestamp)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_type_timestamp ON entries (type, timestamp)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            has_rollups = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollups'"
+            ).fetchone()
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "bucket TEXT NOT NULL, key TEXT NOT NULL, count INTEGER NOT NULL, total REAL NOT NULL, "
+                "PRIMARY KEY (bucket, key)) WITHOUT ROWID"
+            )
+            needs_rollups = not has_rollups and self.conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone()
+        if needs_rollups or removed:
+            # database predates rollups, or duplicates were just dropped from it
+            self.rebuild_rollups(verify=False)
+        if removed:
+            print(f"[EntriesLog] Removed {removed} duplicate entries left by earlier imports.")
+            if self.search_index:
+                self.search_index.mark_stale()
+
+    def _add_data_hashes(self):
+        # Upgrades a database from before data_hash: fills it in and drops the
+        # duplicates earlier imports created (keeping the first copy), so the
+        # unique index can be built. Caller holds the lock and the transaction.
+        self.conn.execute("ALTER TABLE entries ADD COLUMN data_hash TEXT")
+        rows = self.conn.execute("SELECT id, timestamp, type, data FROM entries").fetchall()
+        self.conn.executemany(
+            "UPDATE entries SET data_hash = ? WHERE id = ?",
+            [(self.data_hash(self._row_to_entry(row)["data"]), row[0]) for row in rows],
+        )
+        return self.conn.execute(
+            "DELETE FROM entries WHERE id NOT IN (SELECT MIN(id) FROM entries GROUP BY timestamp, type, data_hash)"
+        ).rowcount
+
+    @staticmethod
+    def data_hash(data):
+        normalised = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha1(normalised.encode("utf-8")).hexdigest()
+
+    def _insert_entry(self, entry):
+        # caller holds the lock and the transaction; returns the new id, or None for a duplicate
+        data = entry.get("data", {})
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO entries (timestamp, type, data, data_hash) VALUES (?, ?, ?, ?)",
+            (entry.get("timestamp", ""), entry.get("type", ""), json.dumps(data), self.data_hash(data)),
+        )
+        if not cur.rowcount:
+            return None
+        self._apply_rollups(entry)
+        return cur.lastrowid
+
+    def _migrate_legacy_entries(self):
+        # One-time import of entries.json (a JSON list, newest first). Completion
+        # is recorded in the meta table in the same transaction as the inserts,
+        # so a crash before the file is renamed can't import it a second time.
+        if not os.path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, 'r') as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            legacy = []
+        except Exception as e:
+            print(f"[EntriesLog] Error reading legacy entries: {e}")
+            return
+
+        try:
+            entries = [e for e in reversed(legacy if isinstance(legacy, list) else []) if isinstance(e, dict)]
+            with self.lock, self.conn:
+                # rows without the meta marker come from a build that didn't record it
+                migrated = self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_entries_migrated'").fetchone() \
+                    or self.conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone()
+                if not migrated:
+                    for entry in entries:
+                        self._insert_entry(entry)
+                    self.conn.execute(
+                        "INSERT INTO meta (key, value) VALUES ('legacy_entries_migrated', ?)",
+                        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),),
+                    )
+            os.replace(self.filepath, self.filepath + ".migrated")
+            if migrated:
+                print("[EntriesLog] Legacy entries were already migrated; renamed the leftover file.")
+                return
+            if self.search_index:
+                self.search_index.mark_stale()
+            print(f"[EntriesLog] Migrated {len(entries)} entries to SQLite.")
+        except Exception as e:
+            print(f"[EntriesLog] Error migrating legacy entries: {e}")
+
+    @staticmethod
+    def _row_to_entry(row):
+        try:
+            data = json.loads(row[3])
+        except (json.JSONDecodeError, TypeError):
+            data = {}
+        return {"timestamp": row[1], "type": row[2], "data": data}
+
+    def add_entry(self, entry_type, data):
+        entry = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "type": entry_type, "data": copy.deepcopy(data)}
+        persistence_writer.submit("entry", lambda: self._write_entry(entry))
+        return entry
+
+    def _write_entry(self, entry):
+        try:
+            with self.lock, self.conn:
+                entry_id = self._insert_entry(entry)
+        except Exception as e:
+            print(f"[EntriesLog] Error saving entry: {e}")
+            return
+        if entry_id is not None and self.search_index:
+            self.search_index.add_document("entry", entry_id, entry["timestamp"], SearchIndex.entry_text(entry["data"]))
+
+    # --- rollups ---
+    # Materialised statistics kept in the same database and updated in the same
+    # transaction as each insert: a constant number of upserts per entry, and a
+    # single primary-key lookup per statistic read. Buckets are "all",
+    # "day:YYYY-MM-DD" and "week:YYYY-Www"; keys are "type:<entry type>",
+    # "checkin:<step>:<choice>" and "dbt:<rating key>" (count + rating total).
+
+    @staticmethod
+    def rollup_deltas(entry):
+        # (bucket, key, count, total) increments contributed by one entry
+        timestamp = entry.get("timestamp", "")
+        day = timestamp[:10]
+        try:
+            year, week, _ = datetime.strptime(day, "%Y-%m-%d").isocalendar()
+            week_bucket = f"week:{year}-W{week:02d}"
+        except ValueError:
+            week_bucket = "week:unknown"
+        buckets = ("all", f"day:{day}", week_bucket)
+        entry_type = entry.get("type", "")
+        data = entry.get("data") or {}
+
+        deltas = [(bucket, f"type:{entry_type}", 1, 0.0) for bucket in buckets]
+        if entry_type == "Check-in":
+            details = data.get("details") or {}
+            for _, _, key in CHECKIN_STEPS:
+                if details.get(key):
+                    deltas.extend((bucket, f"checkin:{key}:{details[key]}", 1, 0.0) for bucket in ("all", week_bucket))
+        elif entry_type == "DBT":
+            for question in DBT_QUESTIONS:
+                rating = MoodAnalytics._rating(data.get(question["key"]))
+                if rating == rating:  # not NaN
+                    deltas.extend((bucket, f"dbt:{question['key']}", 1, rating) for bucket in ("all", week_bucket))
+        return deltas
+
+    def _apply_rollups(self, entry):
+        # caller holds the lock and the transaction
+        self.conn.executemany(
+            "INSERT INTO rollups (bucket, key, count, total) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(bucket, key) DO UPDATE SET count = count + excluded.count, total = total + excluded.total",
+            self.rollup_deltas(entry),
+        )
+
+    def get_rollup(self, bucket, key):
+        """(count, total) for one statistic; (0, 0.0) if nothing was recorded."""
+        try:
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT count, total FROM rollups WHERE bucket = ? AND key = ?", (bucket, key)
+                ).fetchone()
+        except Exception as e:
+            print(f"[EntriesLog] Error reading rollup: {e}")
+            row = None
+        return (row[0], row[1]) if row else (0, 0.0)
+
+    def count_by_type(self, entry_type, day=None, week=None):
+        # day as "YYYY-MM-DD", week as "YYYY-Www"
+        bucket = f"day:{day}" if day else f"week:{week}" if week else "all"
+        return self.get_rollup(bucket, f"type:{entry_type}")[0]
+
+    def checkin_histogram(self, step_key, week=None):
+        choices = next((c for _, c, key in CHECKIN_STEPS if key == step_key), [])
+        bucket = f"week:{week}" if week else "all"
+        return {choice: self.get_rollup(bucket, f"checkin:{step_key}:{choice}")[0] for choice in choices}
+
+    def dbt_average(self, rating_key, week=None):
+        count, total = self.get_rollup(f"week:{week}" if week else "all", f"dbt:{rating_key}")
+        return total / count if count else None
+
+    def rebuild_rollups(self, verify=True):
+        """Recompute every rollup from the raw entries and replace the stored table.
+
+        With verify, returns the list of (bucket, key, stored, recomputed)
+        mismatches found before the table was replaced.
+        """
+        mismatches = []
+        try:
+            # read and replace in one locked transaction so an entry added
+            # meanwhile can't be counted by neither the scan nor the table
+            with self.lock, self.conn:
+                fresh = {}
+                rows = self.conn.execute("SELECT id, timestamp, type, data FROM entries ORDER BY id")
+                for row in rows:
+                    for bucket, key, count, total in self.rollup_deltas(self._row_to_entry(row)):
+                        current = fresh.get((bucket, key), (0, 0.0))
+                        fresh[(bucket, key)] = (current[0] + count, current[1] + total)
+                if verify:
+                    stored = {(b, k): (c, t) for b, k, c, t in self.conn.execute("SELECT bucket, key, count, total FROM rollups")}
+                    for name in sorted(set(stored) | set(fresh)):
+                        old, new = stored.get(name, (0, 0.0)), fresh.get(name, (0, 0.0))
+                        if old[0] != new[0] or abs(old[1] - new[1]) > 1e-6:
+                            mismatches.append((name[0], name[1], old, new))
+                self.conn.execute("DELETE FROM rollups")
+                self.conn.executemany(
+                    "INSERT INTO rollups (bucket, key, count, total) VALUES (?, ?, ?, ?)",
+                    [(b, k, c, t) for (b, k), (c, t) in fresh.items()],
+                )
+        except Exception as e:
+            print(f"[EntriesLog] Error rebuilding rollups: {e}")
+        if mismatches:
+            print(f"[EntriesLog] Rollup rebuild fixed {len(mismatches)} mismatched statistics.")
+        return mismatches
+
+    def iter_entry_rows(self, batch_size=500):
+        # streams (id, entry) in insertion order, one batch of rows in memory at a time
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT id, timestamp, type, data FROM entries WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], self._row_to_entry(row)
+            last_id = rows[-1][0]
+
+    def iter_index_docs(self):
+        # (id, timestamp, text) for SearchIndex.rebuild
+        for entry_id, entry in self.iter_entry_rows():
+            yield entry_id, entry["timestamp"], SearchIndex.entry_text(entry["data"])
+
+    def import_entries(self, entries):
+        """Insert pre-timestamped entries (e.g. from an export) in one transaction.
+
+        Returns (imported, skipped); entries already stored are skipped.
+        """
+        docs = []
+        try:
+            with self.lock, self.conn:
+                for entry in entries:
+                    entry_id = self._insert_entry(entry)
+                    if entry_id is not None:
+                        docs.append((entry_id, entry.get("timestamp", ""), SearchIndex.entry_text(entry.get("data", {}))))
+        except Exception as e:
+            print(f"[EntriesLog] Error importing entries: {e}")
+            return 0, 0
+        if self.search_index:
+            for entry_id, timestamp, text in docs:
+                self.search_index.add_document("entry", entry_id, timestamp, text)
+        return len(docs), len(entries) - len(docs)
+
+    def query_entries(self, start=None, end=None, entry_type=None, cursor=None, limit=None):
+        """Return (entries, next_cursor), newest first.
+
+        start/end are inclusive "%Y-%m-%d %H:%M:%S" bounds. Pass the returned
+        cursor back in to fetch the next page; it is None on the last page.
+        """
+        limit = limit or self.PAGE_SIZE
+        clauses, params = [], []
+        if entry_type is not None:
+            clauses.append("type = ?")
+            params.append(entry_type)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        if cursor is not None:
+            clauses.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        sql = f"SELECT id, timestamp, type, data FROM entries{where} ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        try:
+            with self.lock:
+                rows = self.conn.execute(sql, params).fetchall()
+        except Exception as e:
+            print(f"[EntriesLog] Error querying entries: {e}")
+            return [], None
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][1], rows[-1][0])
+        return [self._row_to_entry(r) for r in rows], next_cursor
+
+    def count_entries(self, entry_type=None):
+        sql, params = "SELECT COUNT(*) FROM entries", []
+        if entry_type is not None:
+            sql += " WHERE type = ?"
+            params.append(entry_type)
+        try:
+            with self.lock:
+                return self.conn.execute(sql, params).fetchone()[0]
+        except Exception as e:
+            print(f"[EntriesLog] Error counting entries: {e}")
+            return 0
+
+    def get_all_entries(self):
+        try:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT id, timestamp, type, data FROM entries ORDER BY timestamp DESC, id DESC"
+                ).fetchall()
+            return [self._row_to_entry(r) for r in rows]
+        except Exception as e:
+            print(f"[EntriesLog] Error loading entries: {e}")
+            return []
+
+    @property
+    def entries(self):
+        return self.get_all_entries()
+
+    def close(self):
+        try:
+            with self.lock:
+                self.conn.close()
+        except Exception as e:
+            print(f"[EntriesLog] Error closing database: {e}")
+
+class SearchIndex:
+    # Inverted index over journal entries and Jerry conversations, kept in its
+    # own SQLite file. Postings are clustered by term and carry a precomputed
+    # length-normalised weight, so ranking a query only touches the postings of
+    # its terms; prefix queries expand through the terms table. Documents are
+    # indexed as they are written. A needs_rebuild row in the meta table marks
+    # the index stale (new file, migration, import); it is cleared only by the
+    # commit that finishes a rebuild, so a stale index survives a restart. The
+    # rebuild runs on the first search, on its own thread so store writes don't
+    # queue behind it.
+    TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+    STOPWORDS = frozenset(
+        "a an and are as at be but by for from had has have i i'm if in is it its me my "
+        "of on or so that the their them then there they this to was we were what when "
+        "with you your".split()
+    )
+    MAX_PREFIX_TERMS = 16
+    PREFIX_WEIGHT = 0.5  # completions of a prefix rank below exact matches
+    SNIPPET_CHARS = 160
+    REBUILD_BATCH = 500
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        self.stale_during_rebuild = False
+        self.rebuild_keys = None  # while rebuilding: keys of every document indexed since it began
+        self.sources = {}
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        with self.lock, self.conn:
+            has_meta = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'"
+            ).fetchone()
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            if not has_meta:
+                # a new file, or one from before the marker existed: nothing says it is complete
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('needs_rebuild', '1')")
+            self.needs_rebuild = self.conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'needs_rebuild'"
+            ).fetchone() is not None
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, ref TEXT NOT NULL, "
+                "timestamp TEXT NOT NULL, snippet TEXT NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, doc_id INTEGER NOT NULL, weight REAL NOT NULL, "
+                "PRIMARY KEY (term, doc_id)) WITHOUT ROWID"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+
+    @classmethod
+    def tokenize(cls, text):
+        return [t for t in cls.TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in cls.STOPWORDS]
+
+    @staticmethod
+    def entry_text(data):
+        # flattens the string values of an entry's data dict (answers, lists, summaries)
+        if isinstance(data, str):
+            return data
+        if isinstance(data, dict):
+            return " ".join(SearchIndex.entry_text(v) for v in data.values())
+        if isinstance(data, (list, tuple)):
+            return " ".join(SearchIndex.entry_text(v) for v in data)
+        return ""
+
+    @staticmethod
+    def session_text(session):
+        return " ".join(
+            m.get("content", "") for m in session.get("conversation", [])
+            if isinstance(m, dict) and isinstance(m.get("content"), str)
+        )
+
+    def register_source(self, kind, iter_docs):
+        # iter_docs() yields (ref, timestamp, text) for every stored document of this kind
+        self.sources[kind] = iter_docs
+
+    def mark_stale(self):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('needs_rebuild', '1')")
+                self.needs_rebuild = True
+                if self.rebuilding:
+                    # the running rebuild may already have read the old sources
+                    self.stale_during_rebuild = True
+        except Exception as e:
+            print(f"[SearchIndex] Error marking index stale: {e}")
+
+    def _add_documents(self, docs):
+        # docs: iterable of (kind, ref, timestamp, text); caller holds the lock
+        postings, df_deltas = [], {}
+        for kind, ref, timestamp, text in docs:
+            counts = {}
+            for term in self.tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            if not counts:
+                continue
+            doc_id = self.conn.execute(
+                "INSERT INTO docs (kind, ref, timestamp, snippet) VALUES (?, ?, ?, ?)",
+                (kind, str(ref), timestamp, " ".join(text.split())[:self.SNIPPET_CHARS]),
+            ).lastrowid
+            norm = 1.0 + sum(counts.values()) / 50.0
+            for term, tf in counts.items():
+                postings.append((term, doc_id, tf / norm))
+                df_deltas[term] = df_deltas.get(term, 0) + 1
+        postings.sort()  # insert in primary-key order for B-tree locality
+        self.conn.executemany("INSERT INTO postings (term, doc_id, weight) VALUES (?, ?, ?)", postings)
+        self.conn.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            list(df_deltas.items()),
+        )
+
+    def _unseen(self, docs):
+        # Drops documents already indexed during a running rebuild: one written
+        # while the rebuild reads the sources can arrive both ways. Caller holds the lock.
+        if self.rebuild_keys is None:
+            return docs
+        fresh = []
+        for doc in docs:
+            key = (doc[0], str(doc[1]), hashlib.sha1(doc[3].encode('utf-8')).digest())
+            if key not in self.rebuild_keys:
+                self.rebuild_keys.add(key)
+                fresh.append(doc)
+        return fresh
+
+    def add_document(self, kind, ref, timestamp, text):
+        try:
+            with self.lock, self.conn:
+                self._add_documents(self._unseen([(kind, ref, timestamp, text)]))
+        except Exception as e:
+            print(f"[SearchIndex] Error indexing {kind} {ref}: {e}")
+
+    def start_rebuild(self):
+        if self.rebuilding:
+            return
+        self.rebuilding = True
+        threading.Thread(target=self.rebuild, name="SearchIndexRebuild", daemon=True).start()
+
+    def rebuild(self):
+        # Commits in batches so searches (and the UI) aren't locked out for the whole rebuild.
+        started = time.perf_counter()
+        count = 0
+        self.rebuilding = True
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('needs_rebuild', '1')")
+                self.conn.execute("DELETE FROM postings")
+                self.conn.execute("DELETE FROM terms")
+                self.conn.execute("DELETE FROM docs")
+                self.rebuild_keys = set()
+                self.stale_during_rebuild = False
+            for kind, iter_docs in list(self.sources.items()):
+                batch = []
+                for ref, timestamp, text in iter_docs():
+                    batch.append((kind, ref, timestamp, text))
+                    if len(batch) >= self.REBUILD_BATCH:
+                        with self.lock, self.conn:
+                            self._add_documents(self._unseen(batch))
+                        count += len(batch)
+                        batch = []
+                        time.sleep(0.001)  # let a waiting writer or search take the lock
+                with self.lock, self.conn:
+                    self._add_documents(self._unseen(batch))
+                count += len(batch)
+            with self.lock, self.conn:
+                if not self.stale_during_rebuild:
+                    self.conn.execute("DELETE FROM meta WHERE key = 'needs_rebuild'")
+                    self.needs_rebuild = False
+            print(f"[SearchIndex] Rebuilt {count} documents in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"[SearchIndex] Error rebuilding index: {e}")
+        finally:
+            with self.lock:
+                self.rebuild_keys = None
+            self.rebuilding = False
+        return count
+
+    def _expand(self, token, prefix):
+        if not prefix:
+            row = self.conn.execute("SELECT term, df FROM terms WHERE term = ?", (token,)).fetchone()
+            return [row] if row else []
+        # every term starting with token sorts between token and token + U+10FFFF
+        return self.conn.execute(
+            "SELECT term, df FROM terms WHERE term >= ? AND term < ? ORDER BY df DESC LIMIT ?",
+            (token, token + "\U0010ffff", self.MAX_PREFIX_TERMS),
+        ).fetchall()
+
+    def search(self, query, limit=20, kind=None, prefix_last=True):
+        """Ranked matches for query, best first.
+
+        A token ending in "*" is a prefix query; with prefix_last the final
+        token is also treated as a prefix (search-as-you-type). Scores are
+        tf-idf summed over matched terms, normalised by document length.
+        While a lazy rebuild is running (see `rebuilding`) results are partial.
+        """
+        if self.needs_rebuild and self.sources and not self.rebuilding:
+            self.start_rebuild()
+
+        raw_tokens = query.lower().split()
+        weighted = {}
+        try:
+            with self.lock:
+                total_docs = self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+                if not total_docs:
+                    return []
+                for i, raw in enumerate(raw_tokens):
+                    prefix = raw.endswith("*") or (prefix_last and i == len(raw_tokens) - 1)
+                    for token in self.tokenize(raw.rstrip("*")):
+                        for term, df in self._expand(token, prefix):
+                            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                            if term != token:
+                                idf *= self.PREFIX_WEIGHT
+                            weighted[term] = max(weighted.get(term, 0), idf)
+                if not weighted:
+                    return []
+
+                terms = list(weighted)
+                cases = " ".join("WHEN ? THEN ?" for _ in terms)
+                params = [v for term in terms for v in (term, weighted[term])] + terms
+                kind_filter = ""
+                if kind is not None:
+                    kind_filter = " AND doc_id IN (SELECT id FROM docs WHERE kind = ?)"
+                    params.append(kind)
+                params.append(limit)
+                rows = self.conn.execute(
+                    f"SELECT d.kind, d.ref, d.timestamp, d.snippet, top.score FROM ("
+                    f"SELECT doc_id, SUM(weight * (CASE term {cases} END)) AS score FROM postings "
+                    f"WHERE term IN ({','.join('?' for _ in terms)}){kind_filter} "
+                    f"GROUP BY doc_id ORDER BY score DESC LIMIT ?"
+                    f") AS top JOIN docs d ON d.id = top.doc_id ORDER BY top.score DESC, d.timestamp DESC",
+                    params,
+                ).fetchall()
+        except Exception as e:
+            print(f"[SearchIndex] Error searching for {query!r}: {e}")
+            return []
+
+        return [
+            {"kind": r[0], "ref": r[1], "timestamp": r[2], "snippet": r[3], "score": round(r[4], 4)}
+            for r in rows
+        ]
+
+class ConversationRetriever:
+    # Okapi BM25 over past Jerry conversations, chunked into snippets of one
+    # user message plus Jerry's reply. Kept in its own SQLite file and updated
+    # as each session is written; rebuilt on its own thread from the
+    # conversation log while the meta table marks it stale (same scheme as
+    # SearchIndex). Used to give Jerry a few relevant past moments instead of
+    # whole old transcripts.
+    K1 = 1.2
+    B = 0.75
+    TOP_K = 3
+    MAX_QUERY_TERMS = 12
+    MAX_DF_RATIO = 0.5  # terms in more than half the snippets carry almost no signal
+    SNIPPET_MAX_CHARS = 400
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        self.stale_during_rebuild = False
+        self.rebuild_keys = None  # while rebuilding: keys of every session indexed since it began
+        self.source = None
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        with self.lock, self.conn:
+            has_meta = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'"
+            ).fetchone()
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            if not has_meta:
+                # a new file, or one from before the marker existed: nothing says it is complete
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('needs_rebuild', '1')")
+            self.needs_rebuild = self.conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'needs_rebuild'"
+            ).fetchone() is not None
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS snippets ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, text TEXT NOT NULL, length INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, snippet_id INTEGER NOT NULL, tf INTEGER NOT NULL, "
+                "PRIMARY KEY (term, snippet_id)) WITHOUT ROWID"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.doc_count, self.total_length = self._load_stats()
+
+    def _load_stats(self):
+        with self.lock:
+            stats = dict(self.conn.execute("SELECT key, value FROM stats").fetchall())
+        return stats.get("docs", 0), stats.get("total_length", 0)
+
+    def register_source(self, iter_sessions):
+        # iter_sessions() yields every stored session (used for rebuilds)
+        self.source = iter_sessions
+
+    def mark_stale(self):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('needs_rebuild', '1')")
+                self.needs_rebuild = True
+                if self.rebuilding:
+                    self.stale_during_rebuild = True
+        except Exception as e:
+            print(f"[ConversationRetriever] Error marking index stale: {e}")
+
+    @classmethod
+    def snippets_for(cls, session):
+        # (timestamp, text) per user message, paired with the reply that followed it
+        timestamp = session.get("timestamp", "")
+        messages = [m for m in session.get("conversation", []) if isinstance(m, dict)]
+        for i, message in enumerate(messages):
+            if message.get("role") != "user" or not message.get("content"):
+                continue
+            text = f"You: {message['content']}"
+            if i + 1 < len(messages) and messages[i + 1].get("role") == "assistant":
+                text += f" / Jerry: {messages[i + 1].get('content', '')}"
+            yield timestamp, text[:cls.SNIPPET_MAX_CHARS]
+
+    def _add_sessions(self, sessions):
+        # caller holds the lock and the transaction
+        postings, df_deltas = [], {}
+        added_docs, added_length = 0, 0
+        for session in sessions:
+            for timestamp, text in self.snippets_for(session):
+                counts = {}
+                for term in SearchIndex.tokenize(text):
+                    counts[term] = counts.get(term, 0) + 1
+                if not counts:
+                    continue
+                length = sum(counts.values())
+                snippet_id = self.conn.execute(
+                    "INSERT INTO snippets (timestamp, text, length) VALUES (?, ?, ?)", (timestamp, text, length)
+                ).lastrowid
+                postings.extend((term, snippet_id, tf) for term, tf in counts.items())
+                for term in counts:
+                    df_deltas[term] = df_deltas.get(term, 0) + 1
+                added_docs += 1
+                added_length += length
+        postings.sort()
+        self.conn.executemany("INSERT INTO postings (term, snippet_id, tf) VALUES (?, ?, ?)", postings)
+        self.conn.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            list(df_deltas.items()),
+        )
+        self.doc_count += added_docs
+        self.total_length += added_length
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)",
+            [("docs", self.doc_count), ("total_length", self.total_length)],
+        )
+
+    def _unseen(self, sessions):
+        # see SearchIndex._unseen; caller holds the lock
+        if self.rebuild_keys is None:
+            return sessions
+        fresh = []
+        for session in sessions:
+            key = ConversationLog.session_key(session)
+            if key not in self.rebuild_keys:
+                self.rebuild_keys.add(key)
+                fresh.append(session)
+        return fresh
+
+    def add_session(self, session):
+        try:
+            with self.lock, self.conn:
+                self._add_sessions(self._unseen([session]))
+        except Exception as e:
+            print(f"[ConversationRetriever] Error indexing session: {e}")
+            self.doc_count, self.total_length = self._load_stats()
+
+    def rebuild(self):
+        started = time.perf_counter()
+        self.rebuilding = True
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('needs_rebuild', '1')")
+                for table in ("postings", "terms", "snippets", "stats"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.doc_count, self.total_length = 0, 0
+                self.rebuild_keys = set()
+                self.stale_during_rebuild = False
+            batch = []
+            for session in (self.source() if self.source else []):
+                batch.append(session)
+                if len(batch) >= 200:
+                    with self.lock, self.conn:
+                        self._add_sessions(self._unseen(batch))
+                    batch = []
+                    time.sleep(0.001)  # let a waiting writer or retrieval take the lock
+            with self.lock, self.conn:
+                self._add_sessions(self._unseen(batch))
+                if not self.stale_during_rebuild:
+                    self.conn.execute("DELETE FROM meta WHERE key = 'needs_rebuild'")
+                    self.needs_rebuild = False
+            print(f"[ConversationRetriever] Indexed {self.doc_count} snippets in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"[ConversationRetriever] Error rebuilding index: {e}")
+        finally:
+            with self.lock:
+                self.rebuild_keys = None
+            self.rebuilding = False
+
+    def retrieve(self, query, k=None, token_budget=None):
+        """Top-k past snippets for query by BM25, best first, within token_budget."""
+        k = k or self.TOP_K
+        if self.needs_rebuild and self.source and not self.rebuilding:
+            self.rebuilding = True
+            threading.Thread(target=self.rebuild, name="RetrieverRebuild", daemon=True).start()
+        if not self.doc_count:
+            return []
+
+        query_terms = list(dict.fromkeys(SearchIndex.tokenize(query)))[:self.MAX_QUERY_TERMS]
+        if not query_terms:
+            return []
+        try:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT term, df FROM terms WHERE term IN ({','.join('?' for _ in query_terms)})", query_terms
+                ).fetchall()
+                n = self.doc_count
+                idf = {
+                    term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+                    for term, df in rows if df <= max(1, n * self.MAX_DF_RATIO)
+                }
+                if not idf:
+                    return []
+                terms = list(idf)
+                avgdl = self.total_length / n
+                cases = " ".join("WHEN ? THEN ?" for _ in terms)
+                params = [v for term in terms for v in (term, idf[term])]
+                params += [self.K1 + 1, self.K1, 1 - self.B, self.B / avgdl]
+                params += terms + [k * 2]
+                scored = self.conn.execute(
+                    f"SELECT s.timestamp, s.text, SUM((CASE p.term {cases} END) * p.tf * ? "
+                    f"/ (p.tf + ? * (? + ? * s.length))) AS score "
+                    f"FROM postings p JOIN snippets s ON s.id = p.snippet_id "
+                    f"WHERE p.term IN ({','.join('?' for _ in terms)}) "
+                    f"GROUP BY p.snippet_id ORDER BY score DESC LIMIT ?",
+                    params,
+                ).fetchall()
+        except Exception as e:
+            print(f"[ConversationRetriever] Error retrieving: {e}")
+            return []
+
+        results, used = [], 0
+        for timestamp, text, score in scored:
+            cost = estimate_tokens(text)
+            if token_budget is not None and used + cost > token_budget:
+                continue
+            results.append({"timestamp": timestamp, "text": text, "score": round(score, 4)})
+            used += cost
+            if len(results) >= k:
+                break
+        return results
+
+class JerryCompanion:
+    def __init__(self, state_filepath, state=None):
+        self.state_filepath = state_filepath
+        self.needs = {"clarity": 100, "insight": 100, "calm": 100}
+        self.last_fed = {"clarity": time.time(), "insight": time.time(), "calm": time.time()}
+        self.decay_rates_hours = {"clarity": 24, "insight": 48, "calm": 12}
+        self.xp = 0
+        self.level = 1
+        self.xp_to_next_level = 100
+        self.store = CoalescingJSONStore(state_filepath, self.snapshot_state)
+        if state is not None:
+            self.apply_state(state)
+        else:
+            self.load_state()
+
+    def apply_state(self, state):
+        self.needs = dict(state.get("needs", self.needs))
+        self.last_fed = dict(state.get("last_fed", self.last_fed))
+        self.xp = state.get("xp", self.xp)
+        self.level = state.get("level", self.level)
+        self.xp_to_next_level = state.get("xp_to_next_level", self.xp_to_next_level)
+
+    def load_state(self):
+        try:
+            with open(self.state_filepath, 'r') as f:
+                self.apply_state(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            # create initial state file
+            self.save_state()
+        except Exception as e:
+            print(f"[JerryCompanion] Error loading state: {e}")
+            self.save_state()
+
+    def snapshot_state(self):
+        return {
+            "needs": dict(self.needs),
+            "last_fed": dict(self.last_fed),
+            "xp": self.xp,
+            "level": self.level,
+            "xp_to_next_level": self.xp_to_next_level
+        }
+
+    def save_state(self):
+        # marks the state dirty; the write itself is coalesced by the store
+        self.store.save()
+
+    def flush(self):
+        return self.store.flush()
+
+    def update_needs(self):
+        now = time.time()
+        for n, t in self.last_fed.items():
+            try:
+                decay_rate = self.decay_rates_hours.get(n, 24)
+                self.needs[n] = max(0, 100 - ((now - t) / 3600 / decay_rate) * 100)
+            except Exception:
+                self.needs[n] = self.needs.get(n, 100)
+
+    def feed(self, n, a=100):
+        self.update_needs()
+        if n in self.needs:
+            self.needs[n] = min(100, self.needs[n] + a)
+            self.last_fed[n] = time.time()
+            self.save_state()
+
+    def add_xp(self, a):
+        self.xp += a
+        if self.xp >= self.xp_to_next_level:
+            self.level_up()
+        self.save_state()
+
+    def level_up(self):
+        self.level += 1
+        self.xp -= self.xp_to_next_level
+        self.xp_to_next_level = int(self.xp_to_next_level * 1.5)
+
+class MoodAnalytics:
+    # Column-oriented view of check-in and DBT entries for trend screens.
+    # Ratings and choices are loaded once into NumPy arrays (timestamps as
+    # epoch seconds of the stored local time); every statistic below is a
+    # handful of vectorised bincount/cumsum passes rather than a Python loop.
+    DBT_KEYS = [q["key"] for q in DBT_QUESTIONS if q.get("type") == "rating"]
+    CHECKIN_CHOICES = {key: choices for _, choices, key in CHECKIN_STEPS}
+    MAX_RATING = 5
+    DAY = 86400
+
+    def __init__(self, entries):
+        if np is None:
+            raise RuntimeError("MoodAnalytics requires numpy")
+        dbt_times, dbt_rows = [], []
+        checkin_times = []
+        checkin_codes = {key: [] for key in self.CHECKIN_CHOICES}
+        for entry in entries:
+            data = entry.get("data") or {}
+            if entry.get("type") == "DBT":
+                dbt_times.append(entry.get("timestamp", ""))
+                dbt_rows.append([self._rating(data.get(key)) for key in self.DBT_KEYS])
+            elif entry.get("type") == "Check-in":
+                details = data.get("details") or {}
+                checkin_times.append(entry.get("timestamp", ""))
+                for key, choices in self.CHECKIN_CHOICES.items():
+                    choice = details.get(key)
+                    checkin_codes[key].append(choices.index(choice) if choice in choices else -1)
+
+        # rows whose timestamp is empty or malformed are dropped with their values
+        self.dbt_ts, dated = self._epoch(dbt_times)
+        self.dbt_ratings = np.array(dbt_rows, dtype=np.float64).reshape(-1, len(self.DBT_KEYS))[dated]
+        self.checkin_ts, dated = self._epoch(checkin_times)
+        self.checkin_codes = {key: np.array(codes, dtype=np.int8)[dated] for key, codes in checkin_codes.items()}
+
+    @classmethod
+    def from_entries_log(cls, entries_log):
+        return cls(entry for _, entry in entries_log.iter_entry_rows())
+
+    @staticmethod
+    def _rating(value):
+        # ratings are stored as "0".."5" strings; anything else is missing (NaN)
+        try:
+            rating = float(value)
+        except (TypeError, ValueError):
+            return float("nan")
+        return rating if 0 <= rating <= MoodAnalytics.MAX_RATING else float("nan")
+
+    @staticmethod
+    def _parse_time(timestamp):
+        try:
+            return np.datetime64(timestamp.replace(" ", "T"), "s")
+        except (AttributeError, ValueError):
+            return np.datetime64("NaT", "s")
+
+    @classmethod
+    def _epoch(cls, timestamps):
+        # (epoch seconds, mask) for the timestamps that parse; an empty string
+        # parses to NaT, which as int64 would be INT64_MIN
+        if not timestamps:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+        try:
+            stamps = np.array([t.replace(" ", "T") for t in timestamps], dtype="datetime64[s]")
+        except (AttributeError, ValueError):
+            # at least one malformed value: parse one by one
+            stamps = np.array([cls._parse_time(t) for t in timestamps], dtype="datetime64[s]")
+        dated = ~np.isnat(stamps)
+        return stamps[dated].astype(np.int64), dated
+
+    def _column(self, key):
+        if key not in self.DBT_KEYS:
+            raise KeyError(f"Unknown DBT rating: {key}")
+        return self.dbt_ratings[:, self.DBT_KEYS.index(key)]
+
+    def daily_means(self, key):
+        """(day_epochs, means) for every calendar day between the first and last DBT entry."""
+        values = self._column(key)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        days = self.dbt_ts[valid] // self.DAY
+        first = days.min()
+        sums = np.bincount(days - first, weights=values[valid])
+        counts = np.bincount(days - first)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        return (np.arange(len(sums)) + first) * self.DAY, means
+
+    def rolling_mean(self, key, window_days=7):
+        """(day_epochs, mean over the trailing window) — days without entries are skipped, not zeroed."""
+        values = self._column(key)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        days = self.dbt_ts[valid] // self.DAY
+        first = days.min()
+        sums = np.concatenate(([0.0], np.cumsum(np.bincount(days - first, weights=values[valid]))))
+        counts = np.concatenate(([0], np.cumsum(np.bincount(days - first))))
+        upper = np.arange(1, len(sums))
+        lower = np.maximum(upper - window_days, 0)
+        window_counts = counts[upper] - counts[lower]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (sums[upper] - sums[lower]) / window_counts
+        return (upper - 1 + first) * self.DAY, means
+
+    def weekly_distribution(self, key):
+        """(week_start_epochs, counts) where counts[w, r] is how often rating r was given in week w."""
+        values = self._column(key)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.MAX_RATING + 1), dtype=np.int64)
+        # 1970-01-01 was a Thursday; shifting by 3 days makes weeks start on Monday
+        weeks = (self.dbt_ts[valid] // self.DAY + 3) // 7
+        first = weeks.min()
+        bins = self.MAX_RATING + 1
+        flat = (weeks - first) * bins + values[valid].astype(np.int64)
+        counts = np.bincount(flat, minlength=(weeks.max() - first + 1) * bins).reshape(-1, bins)
+        return ((np.arange(len(counts)) + first) * 7 - 3) * self.DAY, counts
+
+    def crosstab(self, checkin_key, dbt_key):
+        """Check-in choice vs DBT rating on the same day.
+
+        Returns (choices, counts, mean_rating): counts[c, r] is the number of
+        DBT ratings r logged on days the check-in answer was choices[c];
+        mean_rating[c] is the average of those ratings (NaN if none).
+        """
+        choices = self.CHECKIN_CHOICES[checkin_key]
+        bins = self.MAX_RATING + 1
+        empty = np.zeros((len(choices), bins), dtype=np.int64)
+        codes = self.checkin_codes[checkin_key]
+        values = self._column(dbt_key)
+        valid = ~np.isnan(values)
+        if not len(codes) or not valid.any():
+            return choices, empty, np.full(len(choices), np.nan)
+
+        checkin_days = self.checkin_ts // self.DAY
+        dbt_days = self.dbt_ts[valid] // self.DAY
+        ratings = values[valid].astype(np.int64)
+        answered = codes >= 0
+        checkin_days, codes = checkin_days[answered], codes[answered].astype(np.int64)
+
+        # pair every check-in with every DBT rating from the same day
+        order = np.argsort(dbt_days, kind="stable")
+        dbt_days, ratings = dbt_days[order], ratings[order]
+        lo = np.searchsorted(dbt_days, checkin_days, side="left")
+        hi = np.searchsorted(dbt_days, checkin_days, side="right")
+        per_checkin = hi - lo
+        pair_codes = np.repeat(codes, per_checkin)
+        offsets = np.arange(per_checkin.sum()) - np.repeat(np.cumsum(per_checkin) - per_checkin, per_checkin)
+        pair_ratings = ratings[np.repeat(lo, per_checkin) + offsets]
+
+        counts = np.bincount(pair_codes * bins + pair_ratings, minlength=len(choices) * bins).reshape(len(choices), bins)
+        totals = counts.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_rating = (counts * np.arange(bins)).sum(axis=1) / totals
+        return choices, counts, mean_rating
+
+class UserDataTransfer:
+    # Streams every store to and from a single NDJSON file, one record per line,
+    # so exports and imports run in constant memory whatever the history size.
+    # The first line is a header; each later line has a "kind" of "entry",
+    # "session", "memory" or "companion". progress(records, bytes_done, total_bytes)
+    # is called every PROGRESS_EVERY records (total_bytes is None while exporting).
+    FORMAT = "hush-export"
+    VERSION = 1
+    PROGRESS_EVERY = 200
+    IMPORT_BATCH = 200
+
+    def __init__(self, entries_log=None, conversation_log=None, memory=None, companion=None):
+        self.entries_log = entries_log
+        self.conversation_log = conversation_log
+        self.memory = memory
+        self.companion = companion
+
+    def iter_records(self):
+        yield {"kind": "header", "format": self.FORMAT, "version": self.VERSION,
+               "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if self.companion:
+            yield {"kind": "companion", "state": self.companion.snapshot_state()}
+        if self.memory:
+            yield {"kind": "memory", "memory": self.memory.load_memory()}
+        if self.entries_log:
+            for _, entry in self.entries_log.iter_entry_rows():
+                yield dict(entry, kind="entry")
+        if self.conversation_log:
+            for session in self.conversation_log.iter_sessions_chronological():
+                yield dict(session, kind="session")
+
+    def export_to(self, path, progress=None):
+        # Make sure queued writes are on disk, then write to a temp file and rename.
+        persistence_writer.flush()
+        count, written = 0, 0
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.iter_records():
+                line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+                f.write(line)
+                count += 1
+                written += len(line.encode('utf-8'))
+                if progress and count % self.PROGRESS_EVERY == 0:
+                    progress(count, written, None)
+        os.replace(tmp_path, path)
+        if progress:
+            progress(count, written, None)
+        return count
+
+    @classmethod
+    def iter_file(cls, path, progress=None):
+        # yields (record, bytes_read, total_bytes), validating the header line
+        total = os.path.getsize(path)
+        read = 0
+        with open(path, 'rb') as f:
+            for number, raw in enumerate(f):
+                read += len(raw)
+                if not raw.strip():
+                    continue
+                try:
+                    record = json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    print(f"[UserDataTransfer] Skipping unreadable line {number + 1}")
+                    continue
+                if number == 0:
+                    if record.get("kind") != "header" or record.get("format") != cls.FORMAT:
+                        raise ValueError("Not a Hush export file.")
+                    continue
+                yield record, read, total
+
+    def import_from(self, path, progress=None):
+        """Add an export's entries and sessions; memory and companion state are replaced.
+
+        Sessions are spooled to a temp file and merged into the conversation log
+        by timestamp in one writer job. Entries and sessions already stored are
+        skipped, so importing a file twice is harmless. Returns a dict of counts:
+        records read, and entries/sessions imported and skipped.
+        """
+        count, entry_batch = 0, []
+        counts = {"entries_imported": 0, "entries_skipped": 0, "sessions_imported": 0, "sessions_skipped": 0}
+        read, total = 0, os.path.getsize(path)
+        spool, spooled = None, 0
+
+        def import_batch(batch):
+            imported, skipped = self.entries_log.import_entries(batch)
+            counts["entries_imported"] += imported
+            counts["entries_skipped"] += skipped
+
+        try:
+            for record, read, total in self.iter_file(path):
+                kind = record.pop("kind", None)
+                if kind == "entry" and self.entries_log:
+                    entry_batch.append(record)
+                    if len(entry_batch) >= self.IMPORT_BATCH:
+                        import_batch(entry_batch)
+                        entry_batch = []
+                elif kind == "session" and self.conversation_log:
+                    spooled += 1
+                    if spool is None:
+                        spool = tempfile.NamedTemporaryFile(
+                            'w', encoding='utf-8', suffix=".jsonl", delete=False,
+                            dir=os.path.dirname(os.path.abspath(self.conversation_log.filepath)),
+                        )
+                    spool.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+                elif kind == "memory" and self.memory:
+                    self.memory.save_memory(record.get("memory", {}))
+                elif kind == "companion" and self.companion:
+                    self.companion.apply_state(record.get("state", {}))
+                    self.companion.save_state()
+                count += 1
+                if progress and count % self.PROGRESS_EVERY == 0:
+                    progress(count, read, total)
+            if entry_batch:
+                import_batch(entry_batch)
+            if spool is not None:
+                spool.close()
+                counts["sessions_imported"] = self.conversation_log.import_sessions(spool.name).result()
+                counts["sessions_skipped"] = spooled - counts["sessions_imported"]
+        finally:
+            if spool is not None:
+                spool.close()
+                try:
+                    os.remove(spool.name)
+                except OSError:
+                    pass
+        if progress:
+            progress(count, read, total)
+        print(f"[UserDataTransfer] Imported {count} records: {counts}")
+        return dict(counts, records=count)
+
+    def run_async(self, method, path, progress=None, on_done=None):
+        # runs export_to/import_from on a worker; callbacks are delivered on the UI thread
+        def ui_progress(*args):
+            call_on_ui(lambda: progress(*args))
+
+        def run():
+            try:
+                result = method(path, progress=ui_progress if progress else None)
+            except Exception as e:
+                print(f"[UserDataTransfer] {method.__name__} error: {e}")
+                result = e
+            if on_done:
+                call_on_ui(lambda: on_done(result))
+        threading.Thread(target=run, name="UserDataTransfer", daemon=True).start()
+
+StartupSnapshot = namedtuple(
+    "StartupSnapshot",
+    ["settings", "companion_state", "memory", "conversation_log", "retriever", "response_cache", "entries_log",
+     "search_index", "timings"],
+)
+
+def _read_only(value):
+    return MappingProxyType(value) if isinstance(value, dict) else value
+
+class StartupLoader:
+    # Reads every store in parallel on worker threads and hands the UI one
+    # immutable StartupSnapshot, with per-file timings in milliseconds. Every
+    # store object is constructed (and migrated, if needed) on the workers too,
+    # so building JerryAI from the snapshot does no disk I/O on the UI thread;
+    # the SQLite connections are safe to use from the UI thread afterwards.
+    MAX_WORKERS = 4
+
+    def __init__(self, base_dir, settings_path):
+        self.base_dir = base_dir
+        self.settings_path = settings_path
+        self.conversation_log_path = os.path.join(base_dir, "conversation_log.json")
+        self.jerry_memory_path = os.path.join(base_dir, "jerry_memory.json")
+        self.jerry_state_path = os.path.join(base_dir, "jerry_state.json")
+        self.entries_filepath = os.path.join(base_dir, "entries.json")
+        self.search_index_path = os.path.join(base_dir, "search_index.db")
+        self.retrieval_index_path = os.path.join(base_dir, "conversation_retrieval.db")
+        self.response_cache_path = os.path.join(base_dir, "response_cache.json")
+
+    @staticmethod
+    def _read_json(path):
+        # None means "missing or unreadable"; the owning store falls back to defaults
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _open_entries(self):
+        # entries still open (unindexed) if the search index can't be
+        try:
+            search_index = SearchIndex(self.search_index_path)
+        except Exception as e:
+            print(f"[StartupLoader] Search index unavailable: {e}")
+            search_index = None
+        return EntriesLog(self.entries_filepath, search_index=search_index), search_index
+
+    def _open_response_cache(self, persist):
+        if persist:
+            return ResponseCache(self.response_cache_path)
+        # replies cached on disk before the setting existed
+        ResponseCache.remove_file(self.response_cache_path)
+        return ResponseCache()
+
+    def load(self):
+        tasks = {
+            "app_settings.json": lambda: self._read_json(self.settings_path),
+            "jerry_state.json": lambda: self._read_json(self.jerry_state_path),
+            "jerry_memory.json": lambda: self._read_json(self.jerry_memory_path),
+            "entries.db": self._open_entries,
+            "conversation_retrieval.db": lambda: ConversationRetriever(self.retrieval_index_path),
+        }
+
+        def timed(fn):
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                print(f"[StartupLoader] load error: {e}")
+                result = None
+            return result, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+            futures = {name: pool.submit(timed, fn) for name, fn in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        entries_log, search_index = results["entries.db"][0] or (None, None)
+        retriever = results["conversation_retrieval.db"][0]
+        settings = results["app_settings.json"][0]
+        results["response_cache.json"] = timed(lambda: self._open_response_cache(
+            isinstance(settings, dict) and bool(settings.get("CACHE_REPLIES", False))))
+        # the conversation log registers with both indexes, so it opens once they exist
+        results["conversation log"] = timed(lambda: ConversationLog(
+            self.conversation_log_path, search_index=search_index, retriever=retriever))
+        timings = {name: round(ms, 2) for name, (_, ms) in results.items()}
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+
+        state = results["jerry_state.json"][0]
+        memory = results["jerry_memory.json"][0]
+        return StartupSnapshot(
+            settings=_read_only(settings),
+            companion_state=_read_only(state if isinstance(state, dict) else {}),
+            memory=_read_only(memory if isinstance(memory, dict) else {}),
+            conversation_log=results["conversation log"][0],
+            retriever=retriever,
+            response_cache=results["response_cache.json"][0],
+            entries_log=entries_log,
+            search_index=search_index,
+            timings=MappingProxyType(timings),
+        )
+
+    def load_async(self, callback):
+        # runs load() on a worker thread and delivers the snapshot on the UI thread
+        def run():
+            snapshot = self.load()
+            call_on_ui(lambda: callback(snapshot))
+        threading.Thread(target=run, name="StartupLoader", daemon=True).start()
+
+def fallback_response(user_input):
+    # canned offline replies used when no model backend is reachable
+    user_input = user_input.lower()
+    responses = {
+        "hello": "Hello! It's good to see you.",
+        "hi": "Hello! It's good to see you.",
+        "how are you": "I'm doing well, thank you! How can I help you today?",
+        "thank": "You're very welcome!",
+        "bye": "Goodbye! Have a great day!"
+    }
+    for key, value in responses.items():
+        if key in user_input:
+            return value
+    return "I'm here to listen. Tell me what's on your mind."
+
+def last_user_message(messages):
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+class ChatBackend:
+    # What JerryAI talks to. submit() is safe to call from any thread and
+    # returns a concurrent.futures.Future resolving to the reply text;
+    # callback(future) runs once it settles, and on_delta(text_piece) as a
+    # streamed reply arrives (backends that can't stream just never call it).
+    name = "base"
+    remote = False  # replies cost a model round trip: worth caching, and used for summaries
+
+    def __init__(self):
+        self.pending = set()
+
+    def submit(self, messages, callback=None, timeout=None, on_delta=None):
+        raise NotImplementedError
+
+    def _track(self, future, callback):
+        self.pending.add(future)
+
+        def done(f):
+            self.pending.discard(f)
+            if callback:
+                try:
+                    callback(f)
+                except Exception as e:
+                    print(f"[{type(self).__name__}] Callback error: {e}")
+        future.add_done_callback(done)
+        return future
+
+    def cancel_pending(self):
+        # cancels in-flight requests; their callbacks see future.cancelled()
+        for future in list(self.pending):
+            future.cancel()
+
+    def probe(self, timeout=5.0):
+        # Future resolving to True when the backend looks reachable
+        future = Future()
+        future.set_result(True)
+        return future
+
+    def warm(self, timeout=10.0):
+        # set up whatever the first request would otherwise pay for (DNS, TCP, TLS)
+        return self.probe(timeout)
+
+    def is_warm(self):
+        # False when the next request is expected to open a new connection
+        return True
+
+    def set_api_key(self, api_key):
+        pass
+
+    def close(self):
+        self.cancel_pending()
+
+class AsyncChatClient(ChatBackend):
+    # OpenAI-compatible chat client running on one background asyncio loop with
+    # a single keep-alive httpx connection pool, so every turn after the first
+    # reuses the open TLS connection instead of handshaking again. Works with
+    # any OpenAI-compatible base_url (hosted, self-hosted, or the stub server
+    # in tools/chat_bench.py).
+    name = "openai"
+    remote = True
+    BASE_URL = "https://api.openai.com/v1"
+    MODEL = "gpt-3.5-turbo"
+    TEMPERATURE = 0.7
+    TIMEOUT = 30.0
+    CONNECT_TIMEOUT = 10.0
+    KEEPALIVE_EXPIRY = 300.0
+
+    def __init__(self, api_key, base_url=None, model=None, timeout=None):
+        super().__init__()
+        self.api_key = api_key
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        self.model = model or self.MODEL
+        self.timeout = timeout or self.TIMEOUT
+        self.loop = None
+        self.thread = None
+        self.client = None
+        self.start_lock = threading.Lock()
+        self.requests = 0
+        self.last_latency = None
+        self.last_first_token = None
+        self.last_activity = None  # monotonic time the pool last completed a request
+
+    def _ensure_loop(self):
+        with self.start_lock:
+            if self.loop is not None and self.thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name="AsyncChatClient", daemon=True)
+            self.thread.start()
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _get_client(self):
+        # only called on the loop thread
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._headers(),
+                timeout=httpx.Timeout(self.timeout, connect=self.CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4,
+                                    keepalive_expiry=self.KEEPALIVE_EXPIRY),
+            )
+        return self.client
+
+    async def _complete(self, messages, timeout):
+        started = time.perf_counter()
+        payload = {"model": self.model, "messages": messages, "temperature": self.TEMPERATURE}
+        response = await asyncio.wait_for(self._get_client().post("/chat/completions", json=payload), timeout)
+        response.raise_for_status()
+        self.requests += 1
+        self.last_latency = time.perf_counter() - started
+        self.last_activity = time.monotonic()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    async def _stream(self, messages, on_delta):
+        # Server-sent events: "data: {json chunk}" lines until "data: [DONE]"
+        started = time.perf_counter()
+        payload = {"model": self.model, "messages": messages, "temperature": self.TEMPERATURE, "stream": True}
+        parts = []
+        async with self._get_client().stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    # keep reading to the end of the body so the connection goes back to the pool
+                    continue
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError):
+                    continue
+                if delta:
+                    if not parts:
+                        self.last_first_token = time.perf_counter() - started
+                    parts.append(delta)
+                    on_delta(delta)
+        self.requests += 1
+        self.last_latency = time.perf_counter() - started
+        self.last_activity = time.monotonic()
+        return "".join(parts).strip()
+
+    def submit(self, messages, callback=None, timeout=None, on_delta=None):
+        """Start a completion; callback(future) runs on the loop thread when it settles.
+
+        With on_delta the reply is streamed and on_delta(text_piece) is called
+        on the loop thread as each piece arrives; the future still resolves to
+        the full text.
+        """
+        self._ensure_loop()
+        if on_delta:
+            coro = asyncio.wait_for(self._stream(list(messages), on_delta), timeout or self.timeout)
+        else:
+            coro = self._complete(list(messages), timeout or self.timeout)
+        return self._track(asyncio.run_coroutine_threadsafe(coro, self.loop), callback)
+
+    async def _probe(self, timeout):
+        response = await asyncio.wait_for(self._get_client().get("/models"), timeout)
+        self.last_activity = time.monotonic()
+        # an auth error still means the service answered
+        return response.status_code < 500 and response.status_code != 429
+
+    def probe(self, timeout=5.0):
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._probe(timeout), self.loop)
+
+    def warm(self, timeout=10.0):
+        # a cheap GET leaves a resolved, handshaken connection in the keep-alive pool
+        return self.probe(timeout)
+
+    def is_warm(self):
+        return (self.client is not None and self.last_activity is not None
+                and time.monotonic() - self.last_activity < self.KEEPALIVE_EXPIRY)
+
+    def set_api_key(self, api_key):
+        self.api_key = api_key
+        if self.loop is not None and self.client is not None:
+            self.loop.call_soon_threadsafe(self.client.headers.update, self._headers())
+
+    def close(self):
+        self.cancel_pending()
+        if self.loop is None:
+            return
+        if self.client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result(2)
+            except Exception as e:
+                print(f"[AsyncChatClient] close error: {e}")
+            self.client = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+class OpenAISDKBackend(ChatBackend):
+    # The openai package's blocking ChatCompletion call on worker threads; used
+    # for OpenAI-compatible servers when httpx isn't bundled. No streaming.
+    name = "openai-sdk"
+    remote = True
+
+    def __init__(self, api_key, base_url=None, model=None, timeout=None):
+        super().__init__()
+        self.api_key = api_key
+        self.base_url = (base_url or AsyncChatClient.BASE_URL).rstrip("/")
+        self.model = model or AsyncChatClient.MODEL
+        self.timeout = timeout or AsyncChatClient.TIMEOUT
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="OpenAISDKBackend")
+
+    def _complete(self, messages, timeout):
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=messages,
+            temperature=AsyncChatClient.TEMPERATURE,
+            api_key=self.api_key,
+            api_base=self.base_url,
+            request_timeout=timeout,
+        )
+        # compatibility: response.choices[0].message.content or response.choices[0].text
+        try:
+            return response.choices[0].message.content.strip()
+        except Exception:
+            return getattr(response.choices[0], "text", "").strip()
+
+    def submit(self, messages, callback=None, timeout=None, on_delta=None):
+        return self._track(self.executor.submit(self._complete, list(messages), timeout or self.timeout), callback)
+
+    def probe(self, timeout=5.0):
+        return self.executor.submit(
+            lambda: openai.Model.list(api_key=self.api_key, api_base=self.base_url, request_timeout=timeout) is not None
+        )
+
+    def set_api_key(self, api_key):
+        self.api_key = api_key
+
+    def close(self):
+        super().close()
+        self.executor.shutdown(wait=False)
+
+class FallbackBackend(ChatBackend):
+    # Offline canned replies; settles synchronously on the calling thread.
+    name = "fallback"
+
+    def submit(self, messages, callback=None, timeout=None, on_delta=None):
+        future = Future()
+        self._track(future, callback)
+        future.set_result(fallback_response(last_user_message(messages)))
+        return future
+
+def make_chat_backend(kind=None, api_key=None, base_url=None, model=None):
+    """Chat backend by name: "openai" (any OpenAI-compatible base_url) or "fallback".
+
+    With no kind, an API key or base_url selects "openai" and anything else "fallback".
+    """
+    kind = kind or ("openai" if api_key or base_url else "fallback")
+    if kind == "openai":
+        if httpx is not None:
+            return AsyncChatClient(api_key, base_url=base_url, model=model)
+        return OpenAISDKBackend(api_key, base_url=base_url, model=model)
+    if kind != "fallback":
+        print(f"[make_chat_backend] Unknown backend '{kind}', using fallback")
+    return FallbackBackend()
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+def settle_future(future, result=None, error=None):
+    # set a Future's outcome unless it was already settled or cancelled
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return True
+    except InvalidStateError:
+        return False
+
+class ScheduledCall:
+    __slots__ = ("fn", "cancelled")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class TimerThread:
+    # One daemon thread that runs short callbacks when they fall due, so
+    # per-request deadlines and hedges don't cost a threading.Timer (an OS
+    # thread) each. Callbacks must not block; cancelled calls are skipped.
+    def __init__(self, name="TimerThread"):
+        self.name = name
+        self.condition = threading.Condition()
+        self.heap = []  # (due, sequence, ScheduledCall)
+        self.sequence = 0
+        self.thread = None
+
+    def call_later(self, delay, fn):
+        call = ScheduledCall(fn)
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            self.sequence += 1
+            heapq.heappush(self.heap, (time.monotonic() + max(0.0, delay), self.sequence, call))
+            self.condition.notify()
+        return call
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                _, _, call = heapq.heappop(self.heap)
+            if call.cancelled:
+                continue
+            try:
+                call.fn()
+            except Exception as e:
+                print(f"[TimerThread] Callback error: {e}")
+
+chat_timers = TimerThread("ChatTimers")
+
+class ResilientChatBackend(ChatBackend):
+    # Wraps a remote backend with the tail-latency protections:
+    #  - every request has a deadline (DEADLINE unless the caller passes one);
+    #  - if a reply takes longer than the recent p95, a second identical request
+    #    is raced against the first and whichever answers first wins;
+    #  - after FAILURE_THRESHOLD failures in a row the circuit opens and calls
+    #    fail fast with CircuitOpenError (JerryAI answers locally) until a
+    #    background health probe gets through, backing off between probes.
+    # Deadlines, hedges and probes are all scheduled on the shared chat_timers thread.
+    DEADLINE = 20.0
+    HEDGE_PERCENTILE = 95
+    HEDGE_MIN_SAMPLES = 10
+    MIN_HEDGE_DELAY = 0.5
+    LATENCY_WINDOW = 100
+    FAILURE_THRESHOLD = 3
+    PROBE_INTERVAL = 10.0
+    MAX_PROBE_INTERVAL = 120.0
+    PROBE_TIMEOUT = 5.0
+
+    def __init__(self, inner, deadline=None, hedge=True):
+        super().__init__()
+        self.inner = inner
+        self.name = inner.name
+        self.remote = inner.remote
+        self.deadline = deadline or self.DEADLINE
+        self.hedge = hedge
+        self.lock = threading.Lock()
+        self.latencies = []  # seconds to a full reply
+        self.first_token_latencies = []  # seconds to the first streamed piece
+        self.failures = 0
+        self.state = "closed"  # closed -> open -> (probe ok) closed
+        self.probe_interval = self.PROBE_INTERVAL
+        self.probe_timer = None
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+
+    def hedge_delay(self, stream=False):
+        # seconds to wait before racing a second request, or None until enough samples exist;
+        # a streamed reply is hedged on time to its first piece
+        with self.lock:
+            samples = self.first_token_latencies if stream else self.latencies
+            if not self.hedge or len(samples) < self.HEDGE_MIN_SAMPLES:
+                return None
+            return max(self.MIN_HEDGE_DELAY, percentile(sorted(samples), self.HEDGE_PERCENTILE))
+
+    def submit(self, messages, callback=None, timeout=None, on_delta=None, hedge=True):
+        outer = self._track(Future(), callback)
+        with self.lock:
+            short_circuit = self.state == "open"
+            if short_circuit:
+                self.short_circuited += 1
+        if short_circuit:
+            settle_future(outer, error=CircuitOpenError(f"{self.name} backend unavailable"))
+            return outer
+
+        messages = list(messages)
+        deadline = time.monotonic() + (timeout or self.deadline)
+        attempts, errors, timers = [], [], []
+        owner = []  # index of the attempt whose streamed text is shown
+        hedge_pending = []
+
+        submitted = time.perf_counter()
+
+        def forward(index):
+            def on_piece(piece):
+                with self.lock:
+                    if not owner:
+                        owner.append(index)
+                        if hedge:
+                            self._add_sample(self.first_token_latencies, time.perf_counter() - submitted)
+                if owner[0] == index:
+                    on_delta(piece)
+            return on_piece
+
+        def fail_if_exhausted():
+            with self.lock:
+                exhausted = errors and not hedge_pending and all(a is not None and a.done() for a in attempts)
+            if exhausted and settle_future(outer, error=errors[-1]):
+                self._record_failure()
+
+        def finish(future, index, measured):
+            if future.cancelled() or outer.done():
+                return
+            error = future.exception()
+            if error is None:
+                if settle_future(outer, result=future.result()):
+                    self._record_success(time.perf_counter() - submitted if measured else None, hedge_won=index > 0)
+                return
+            with self.lock:
+                errors.append(error)
+            fail_if_exhausted()
+
+        def launch():
+            remaining = deadline - time.monotonic()
+            if outer.done() or remaining <= 0:
+                return
+            with self.lock:
+                index = len(attempts)
+                attempts.append(None)
+            future = self.inner.submit(messages, timeout=remaining, on_delta=forward(index) if on_delta else None)
+            attempts[index] = future
+            future.add_done_callback(lambda f: finish(f, index, hedge))
+
+        def hedge_now():
+            # only race a request that hasn't started answering
+            if not outer.done() and not owner:
+                with self.lock:
+                    self.hedges += 1
+                launch()
+            with self.lock:
+                hedge_pending.clear()
+            fail_if_exhausted()
+
+        def expire():
+            if settle_future(outer, error=FutureTimeoutError(f"no reply within {timeout or self.deadline:.0f}s")):
+                self._record_failure()
+
+        def cleanup(_):
+            for timer in timers:
+                timer.cancel()
+            for future in attempts:
+                if future is not None and not future.done():
+                    future.cancel()
+
+        delay = self.hedge_delay(stream=on_delta is not None) if hedge else None
+        if delay is not None:
+            hedge_pending.append(True)
+        launch()
+        if delay is not None:
+            timers.append(chat_timers.call_later(delay, hedge_now))
+        timers.append(chat_timers.call_later(deadline - time.monotonic(), expire))
+        outer.add_done_callback(cleanup)
+        return outer
+
+    def _add_sample(self, samples, latency):
+        # caller holds the lock
+        samples.append(latency)
+        del samples[:-self.LATENCY_WINDOW]
+
+    def _record_success(self, latency, hedge_won=False):
+        with self.lock:
+            self.failures = 0
+            if hedge_won:
+                self.hedge_wins += 1
+            if latency is not None:
+                self._add_sample(self.latencies, latency)
+
+    def _record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state != "closed" or self.failures < self.FAILURE_THRESHOLD:
+                return
+            self.state = "open"
+        print(f"[ResilientChatBackend] {self.name} failing, answering locally until it recovers")
+        self._schedule_probe()
+
+    def _schedule_probe(self):
+        self.probe_timer = chat_timers.call_later(self.probe_interval, self._probe)
+
+    def _probe(self):
+        # runs on the timer thread, so it only starts the probe and returns
+        try:
+            self.inner.probe(self.PROBE_TIMEOUT).add_done_callback(self._probe_done)
+        except Exception:
+            self._probe_done(None)
+
+    def _probe_done(self, future):
+        try:
+            healthy = bool(future.result())
+        except Exception:
+            healthy = False
+        if self.state != "open":
+            return
+        if healthy:
+            with self.lock:
+                self.state = "closed"
+                self.failures = 0
+                self.probe_interval = self.PROBE_INTERVAL
+            print(f"[ResilientChatBackend] {self.name} reachable again")
+        else:
+            self.probe_interval = min(self.probe_interval * 2, self.MAX_PROBE_INTERVAL)
+            self._schedule_probe()
+
+    def probe(self, timeout=5.0):
+        return self.inner.probe(timeout)
+
+    def warm(self, timeout=10.0):
+        return self.inner.warm(timeout)
+
+    def is_warm(self):
+        return self.inner.is_warm()
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "short_circuited": self.short_circuited,
+            }
+
+    def cancel_pending(self):
+        super().cancel_pending()
+        self.inner.cancel_pending()
+
+    def set_api_key(self, api_key):
+        self.inner.set_api_key(api_key)
+
+    def close(self):
+        if self.probe_timer:
+            self.probe_timer.cancel()
+        super().close()
+        self.inner.close()
+
+def percentile(sorted_values, q):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100.0))]
+
+class ResponseCache:
+    # LRU + TTL cache of Jerry replies, keyed on the normalised user input plus a
+    # digest of the last few chat messages and any other context the reply
+    # depends on, so "hi" at the start of a session hits while the same words
+    # mid-conversation only hit in the same context. With a filepath (the
+    # CACHE_REPLIES setting), entries persist across launches via
+    # CoalescingJSONStore; without one they only live in memory.
+    MAX_ENTRIES = 256
+    TTL_SECONDS = 7 * 24 * 3600
+    CONTEXT_MESSAGES = 2
+    NORMALIZE_RE = re.compile(r"[^\w\s']+", re.UNICODE)
+
+    def __init__(self, filepath=None, max_entries=None, ttl=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.ttl = self.TTL_SECONDS if ttl is None else ttl
+        self.entries = OrderedDict()  # key -> (response, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.filepath = filepath
+        self.store = CoalescingJSONStore(filepath, self.snapshot, indent=None) if filepath else None
+        if filepath:
+            self._load(filepath)
+
+    def set_filepath(self, filepath):
+        """Start persisting to filepath, or stop (None) and delete the file written so far."""
+        if filepath == self.filepath:
+            return
+        old_path, old_store = self.filepath, self.store
+        self.filepath = filepath
+        self.store = CoalescingJSONStore(filepath, self.snapshot, indent=None) if filepath else None
+        if old_store:
+            old_store.discard()
+        if self.store:
+            self.store.save()
+        elif old_path:
+            # queued behind any write already submitted for it
+            persistence_writer.submit("response cache", lambda: self.remove_file(old_path))
+
+    @staticmethod
+    def remove_file(filepath):
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def normalize(cls, text):
+        return " ".join(cls.NORMALIZE_RE.sub(" ", text.lower()).split())
+
+    def make_key(self, user_input, history, extra_context=()):
+        # extra_context: strings that also shape the reply (summary, retrieval state)
+        context = history[-self.CONTEXT_MESSAGES:] if self.CONTEXT_MESSAGES else []
+        parts = [f"{m.get('role')}:{self.normalize(m.get('content', ''))}" for m in context] + list(extra_context)
+        digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+        return f"{self.normalize(user_input)}|{digest}"
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None or item[1] < now:
+                if item is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, response):
+        if not response:
+            return
+        with self.lock:
+            self.entries[key] = (response, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if self.store:
+            self.store.save()
+
+    def snapshot(self):
+        with self.lock:
+            return [[key, response, expires] for key, (response, expires) in self.entries.items()]
+
+    def _load(self, filepath):
+        try:
+            with open(filepath, 'r') as f:
+                rows = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        now = time.time()
+        for row in rows[-self.max_entries:]:
+            try:
+                key, response, expires = row
+            except (TypeError, ValueError):
+                continue
+            if expires > now:
+                self.entries[key] = (response, expires)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+RiskMatch = namedtuple("RiskMatch", ["phrase", "level"])
+
+class RiskDetector:
+    # Aho-Corasick automaton over RISK_PHRASES, compiled once into a complete
+    # transition table so a scan is one dict lookup per character. Cheap enough
+    # to run synchronously on the UI thread for every message and entry.
+    def __init__(self, phrases=None):
+        phrases = phrases or RISK_PHRASES
+        self.patterns = []
+        for level, items in phrases.items():
+            for phrase in items:
+                self.patterns.append(RiskMatch(self.normalize(phrase).strip(), level))
+        self.transitions, self.outputs = self._compile([f" {p.phrase} " for p in self.patterns])
+
+    _PUNCTUATION = {ord(c): " " for c in "!\"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n\r"}
+    _PUNCTUATION.update({ord("'"): None, ord("’"): None})
+
+    @classmethod
+    def normalize(cls, text):
+        return " " + " ".join(text.lower().translate(cls._PUNCTUATION).split()) + " "
+
+    @staticmethod
+    def _compile(keywords):
+        # trie, then BFS for failure links, folding them into full transitions
+        goto, outputs = [{}], [()]
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for ch in keyword:
+                if ch not in goto[state]:
+                    goto.append({})
+                    outputs.append(())
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            outputs[state] += (index,)
+
+        alphabet = {ch for keyword in keywords for ch in keyword}
+        transitions = [dict(edges) for edges in goto]
+        fail = [0] * len(goto)
+        pending = list(goto[0].values())
+        while pending:
+            next_pending = []
+            for state in pending:
+                outputs[state] += outputs[fail[state]]
+                for ch in alphabet:
+                    child = goto[state].get(ch)
+                    if child is None:
+                        # states on this level only point at shallower ones, which are complete
+                        target = transitions[fail[state]].get(ch, 0)
+                        if target:
+                            transitions[state][ch] = target
+                    else:
+                        fail[child] = transitions[fail[state]].get(ch, 0)
+                        next_pending.append(child)
+            pending = next_pending
+        return transitions, outputs
+
+    def scan(self, text):
+        """Distinct RiskMatches found in text, in order of first appearance."""
+        if not text:
+            return []
+        transitions, outputs = self.transitions, self.outputs
+        state, found = 0, []
+        for ch in self.normalize(text):
+            state = transitions[state].get(ch, 0)
+            if outputs[state]:
+                found.extend(outputs[state])
+        return [self.patterns[i] for i in dict.fromkeys(found)]
+
+    def assess(self, text):
+        # highest risk level present in text, or None
+        levels = {match.level for match in self.scan(text)}
+        for level in reversed(RISK_LEVELS):
+            if level in levels:
+                return level
+        return None
+
+    @classmethod
+    def benchmark(cls, rounds=2000):
+        """Build and per-message scan timings in microseconds."""
+        started = time.perf_counter()
+        detector = cls()
+        build_us = (time.perf_counter() - started) * 1e6
+        samples = [
+            "Hey Jerry, work was long today but I went for a walk and feel a little better.",
+            "I keep thinking everyone would be better off without me and I don't see a way out.",
+            "Can you remind me of a grounding exercise? " * 6,
+            random.choice(AFFIRMATIONS) * 20,
+        ]
+        timings = []
+        for _ in range(rounds):
+            for sample in samples:
+                started = time.perf_counter()
+                detector.scan(sample)
+                timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        chars = sum(len(s) for s in samples) / len(samples)
+        return {
+            "patterns": len(detector.patterns),
+            "states": len(detector.transitions),
+            "build_us": round(build_us, 1),
+            "avg_chars": round(chars),
+            "p50_us": round(timings[len(timings) // 2], 2),
+            "p99_us": round(timings[int(len(timings) * 0.99)], 2),
+            "max_us": round(timings[-1], 2),
+        }
+
+def estimate_tokens(text):
+    # ~4 characters per token for English chat text; close enough for budgeting
+    return len(text) // 4 + 1
+
+PendingTurn = namedtuple("PendingTurn", ["user_input", "callback", "stream", "generation"])
+
+class JerryAI:
+    # The prompt is assembled under CONTEXT_TOKEN_BUDGET: the newest turns that
+    # fit, plus a rolling summary of everything older. Turns that fall out of
+    # the window are folded into that summary by a background job and the
+    # summary is kept in JerryMemory, so nothing is simply dropped. Folding
+    # starts once the window overflows and then folds down to
+    # SUMMARY_LOW_WATER of it in one request, so the summary isn't rewritten
+    # on every turn.
+    #
+    # Turns go through a FIFO queue with a single worker, so only one request
+    # is in flight and replies land in chat_history in the order the messages
+    # were sent. Messages typed while Jerry is still answering are merged into
+    # the next request (MERGE_BURSTS) rather than answered one by one.
+    CONTEXT_TOKEN_BUDGET = 1500
+    SUMMARY_MAX_TOKENS = 250
+    SUMMARY_LOW_WATER = 0.75  # share of the turn budget left in use after a fold
+    RETRIEVAL_TOKEN_BUDGET = 250  # reserved for relevant snippets from past sessions
+    MESSAGE_OVERHEAD_TOKENS = 4
+    SUMMARY_TIMEOUT = 20.0
+    TURN_DEADLINE = 20.0  # after this the turn is answered locally
+    LATENCY_SAMPLES = 100
+    MERGE_BURSTS = True
+
+    def __init__(self, jerry, app, conversation_log_path, jerry_memory_path, api_key=None, startup=None,
+                 context_token_budget=None, backend=None, backend_options=None):
+        app_dir = app.user_data_dir if hasattr(app, 'user_data_dir') else os.path.dirname(os.path.abspath(__file__))
+        state_filepath = os.path.join(app_dir, "jerry_state.json")
+        # startup is an optional StartupSnapshot; its preloaded state saves re-reading the files
+        self.companion = JerryCompanion(state_filepath, state=startup.companion_state if startup else None)
+        self.jerry = jerry
+        self.app = app
+        self.retriever = getattr(startup, "retriever", None) or \
+            ConversationRetriever(os.path.join(app_dir, "conversation_retrieval.db"))
+        self.conversation_log = getattr(startup, "conversation_log", None) or ConversationLog(
+            conversation_log_path,
+            search_index=getattr(app, 'search_index', None),
+            retriever=self.retriever,
+        )
+        self.memory = JerryMemory(jerry_memory_path, memory=startup.memory if startup else None)
+        self.api_key = api_key
+        self.chat_lock = threading.Lock()
+        self.is_thinking = False
+        self.chat_history = []
+        self.context_token_budget = context_token_budget or self.CONTEXT_TOKEN_BUDGET
+        self.rolling_summary = self.memory.load_memory().get("rolling_summary", "")
+        self.summarized_count = 0  # chat_history messages already folded into rolling_summary
+        self.summary_running = False
+        self.session_number = 0
+        self.turn_queue = queue.Queue()
+        self.pipeline_thread = None
+        self.pending_turns = 0  # queued or in flight
+        self.generation = 0  # bumped by cancel_pending; older turns are dropped
+        # seconds per answered remote turn, split by whether the connection was already open
+        self.turn_latencies = {"cold": [], "warm": []}
+        # in memory only unless the app hands over a persistent one (CACHE_REPLIES setting)
+        self.response_cache = getattr(startup, "response_cache", None) or ResponseCache()
+        # backend_options: kind / base_url / model for make_chat_backend
+        self.backend_options = dict(backend_options or {})
+        self.backend = self._resilient(backend or make_chat_backend(api_key=self.api_key, **self.backend_options))
+
+        if self.backend.remote:
+            print(f"[JerryAI] Initialized with the {self.backend.name} chat backend.")
+        else:
+            print("[JerryAI] No API key found — running in basic mode.")
+
+        self.system_prompt = "You are Jerry, a friendly, gentle, and supportive AI companion. Keep your responses brief and caring."
+
+    @property
+    def needs(self):
+        return self.companion.needs
+
+    def set_api_key(self, api_key):
+        self.api_key = api_key
+        if not api_key:
+            return
+        if self.backend.remote:
+            self.backend.set_api_key(api_key)
+        elif not self.backend_options.get("kind"):
+            self.backend.close()
+            self.backend = self._resilient(make_chat_backend(api_key=api_key, **self.backend_options))
+
+    def warm_up(self):
+        """Open the backend connection ahead of the first turn; returns a Future (or None)."""
+        if not self.backend.remote:
+            return None
+        started = time.perf_counter()
+
+        def done(future):
+            try:
+                ok = bool(future.result())
+            except BaseException as e:
+                ok = False
+                print(f"[JerryAI] Warm-up error: {e!r}")
+            print(f"[JerryAI] Warm-up {'done' if ok else 'failed'} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        future = self.backend.warm()
+        future.add_done_callback(done)
+        return future
+
+    def latency_report(self):
+        # cold vs warm turn latency in ms, to check what warming the connection buys
+        report = {}
+        for kind, samples in self.turn_latencies.items():
+            ordered = sorted(samples)
+            report[kind] = {
+                "turns": len(ordered),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+            }
+        return report
+
+    def _resilient(self, backend):
+        # remote backends get deadlines, hedging and a circuit breaker
+        if backend.remote and not isinstance(backend, ResilientChatBackend):
+            return ResilientChatBackend(backend, deadline=self.TURN_DEADLINE)
+        return backend
+
+    def cancel_pending(self):
+        # drop queued and in-flight turns (e.g. the user left the Jerry screen)
+        with self.chat_lock:
+            self.generation += 1
+        self.backend.cancel_pending()
+
+    def get_response_thread(self, user_input, callback, stream=None):
+        """Queue a turn; callback(reply) runs on the UI thread once it's answered.
+
+        stream is an optional ChatStream that receives partial text while the
+        reply arrives. A turn merged into a later one gets callback(None).
+        """
+        with self.chat_lock:
+            self.pending_turns += 1
+            self._set_thinking(True)
+        self.turn_queue.put(PendingTurn(user_input, callback, stream, self.generation))
+        if self.pipeline_thread is None or not self.pipeline_thread.is_alive():
+            self.pipeline_thread = threading.Thread(target=self._pipeline_loop, name="JerryAI-pipeline", daemon=True)
+            self.pipeline_thread.start()
+
+    def _cache_key(self, user_input, recalled):
+        # caller holds chat_lock; the reply also depends on the rolling summary
+        # and on the past snippets recalled for this input, not just the last few messages
+        context = [self.rolling_summary] + [
+            hashlib.sha1(f"{r['timestamp']}\x1f{r['text']}".encode("utf-8")).hexdigest()[:12] for r in recalled
+        ]
+        return self.response_cache.make_key(user_input, self.chat_history, context)
+
+    def _set_thinking(self, value):
+        self.is_thinking = value
+        if self.jerry is not None:
+            # the animator reads the latest state when the UI gets to it
+            self.run_on_ui(lambda: setattr(self.jerry, 'is_thinking', self.is_thinking))
+
+    def _pipeline_loop(self):
+        while True:
+            turn = self.turn_queue.get()
+            if turn is None:
+                return
+            batch = [turn]
+            while self.MERGE_BURSTS:
+                try:
+                    queued = self.turn_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if queued is None:
+                    self.turn_queue.put(None)
+                    break
+                batch.append(queued)
+            try:
+                self._answer(batch)
+            except Exception as e:
+                print(f"[JerryAI] Pipeline error: {e}")
+            finally:
+                with self.chat_lock:
+                    self.pending_turns -= len(batch)
+                    self._set_thinking(self.pending_turns > 0)
+
+    def _answer(self, batch):
+        # runs on the pipeline worker: the user turns go into history first, then the request is built from it
+        live = [turn for turn in batch if turn.generation == self.generation]
+        if not live:
+            return
+        user_input = "\n".join(turn.user_input for turn in live)
+        last = live[-1]
+        reply = cache_key = None
+        # retrieved once per turn: it keys the cache lookup and goes into the prompt
+        recalled = self.recall(user_input)
+        with self.chat_lock:
+            if self.backend.remote:
+                cache_key = self._cache_key(user_input, recalled)
+                reply = self.response_cache.get(cache_key)
+            session = self.session_number
+            asked = [{"role": "user", "content": turn.user_input} for turn in live]
+            self.chat_history.extend(asked)
+        committed = None
+        try:
+            committed = self._reply_to(live, user_input, reply, cache_key, recalled, session)
+        finally:
+            if committed is None:
+                self._drop_unanswered(asked)
+        if committed is None:
+            return
+        self.maybe_summarize()
+        for turn in live[:-1]:
+            self.run_on_ui(lambda callback=turn.callback: callback(None))
+        self.run_on_ui(lambda: last.callback(committed))
+
+    def _drop_unanswered(self, asked):
+        # A cancelled or failed turn leaves no user message behind, so the next
+        # prompt doesn't open with two user turns in a row.
+        with self.chat_lock:
+            for message in asked:
+                index = next((i for i, m in enumerate(self.chat_history) if m is message), None)
+                if index is not None and index >= self.summarized_count:
+                    del self.chat_history[index]
+
+    def _reply_to(self, live, user_input, reply, cache_key, recalled, session):
+        # the reply to _answer's turns once it is in chat_history, or None if the turns were dropped
+        last = live[-1]
+        if reply is None:
+            kind = "warm" if self.backend.is_warm() else "cold"
+            started = time.perf_counter()
+            future = self.backend.submit(
+                self.build_messages(recalled=recalled),
+                timeout=self.TURN_DEADLINE,
+                on_delta=last.stream.append if last.stream else None,
+            )
+            try:
+                # the backend enforces the deadline itself; this only guards ones that don't
+                reply = future.result(self.TURN_DEADLINE + 1) or "I'm here to listen."
+                if cache_key:
+                    self.response_cache.put(cache_key, reply)
+                if self.backend.remote:
+                    samples = self.turn_latencies[kind]
+                    samples.append(time.perf_counter() - started)
+                    del samples[:-self.LATENCY_SAMPLES]
+                    if kind == "cold":
+                        print(f"[JerryAI] Cold turn took {samples[-1] * 1000:.0f} ms")
+            except BaseException as e:
+                if future.cancelled():
+                    return
+                if isinstance(e, FutureTimeoutError):
+                    future.cancel()
+                if not isinstance(e, CircuitOpenError):
+                    print(f"[JerryAI] {self.backend.name} backend error: {e!r}")
+                reply = self.get_fallback_response(user_input)
+
+        with self.chat_lock:
+            if session != self.session_number or last.generation != self.generation:
+                return
+            self.chat_history.append({"role": "assistant", "content": reply})
+        return reply
+
+    # --- context assembly ---
+
+    def _message_tokens(self, message):
+        return estimate_tokens(message.get("content", "")) + self.MESSAGE_OVERHEAD_TOKENS
+
+    def _context_window(self, fill=1.0):
+        # (first chat_history index in the prompt, tokens left for turns); caller holds chat_lock.
+        # fill < 1 sizes the window to that share of the turn budget (see maybe_summarize).
+        budget = self.context_token_budget - estimate_tokens(self.system_prompt) - self.MESSAGE_OVERHEAD_TOKENS
+        budget -= self._retrieval_budget()
+        if self.rolling_summary:
+            budget -= estimate_tokens(self.rolling_summary) + self.MESSAGE_OVERHEAD_TOKENS
+        budget = int(budget * fill)
+        start = len(self.chat_history)
+        while start > self.summarized_count:
+            cost = self._message_tokens(self.chat_history[start - 1])
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        return start, budget
+
+    def _retrieval_budget(self):
+        return min(self.RETRIEVAL_TOKEN_BUDGET, self.context_token_budget // 5) if self.retriever else 0
+
+    def recall(self, query):
+        # Past snippets relevant to query, within the retrieval budget. Ones where
+        # the user said exactly this before add nothing to the prompt, and would
+        # make a repeated greeting miss the response cache every session.
+        if not query or not self.retriever:
+            return []
+        echo = ResponseCache.normalize(query)
+        return [
+            r for r in self.retriever.retrieve(query, token_budget=self._retrieval_budget())
+            if ResponseCache.normalize(r["text"].split(" / Jerry: ", 1)[0][len("You: "):]) != echo
+        ]
+
+    def build_messages(self, query=None, recalled=None):
+        """System prompt + rolling summary + past snippets relevant to query + the newest turns that fit.
+
+        Pass recalled (from recall()) instead of query to reuse a retrieval already made.
+        """
+        if recalled is None:
+            recalled = self.recall(query)
+        with self.chat_lock:
+            start, remaining = self._context_window()
+            turns = [dict(m) for m in self.chat_history[start:]]
+            if not turns and self.chat_history and start > self.summarized_count:
+                # a single message bigger than the whole budget: keep its tail
+                last = dict(self.chat_history[-1])
+                keep_chars = max(0, (remaining - self.MESSAGE_OVERHEAD_TOKENS) * 4)
+                last["content"] = last.get("content", "")[-keep_chars:] if keep_chars else ""
+                turns = [last]
+            summary = self.rolling_summary
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Notes from earlier conversations: {summary}"})
+        if recalled:
+            lines = "\n".join(f"- ({r['timestamp'][:10]}) {r['text']}" for r in recalled)
+            messages.append({"role": "system", "content": f"Possibly relevant moments from past conversations:\n{lines}"})
+        return messages + turns
+
+    def maybe_summarize(self):
+        # Folds turns that no longer fit the window into rolling_summary, off the UI thread.
+        with self.chat_lock:
+            if self.summary_running:
+                return
+            start, _ = self._context_window()
+            if start <= self.summarized_count:
+                return
+            # past the high-water mark: fold down to the low-water mark in this one request
+            start, _ = self._context_window(self.SUMMARY_LOW_WATER)
+            folded = [dict(m) for m in self.chat_history[self.summarized_count:start]]
+            upto, session = start, self.session_number
+            previous = self.rolling_summary
+            self.summary_running = True
+
+        def apply(summary):
+            with self.chat_lock:
+                self.rolling_summary = summary
+                if session == self.session_number:
+                    self.summarized_count = upto
+                self.summary_running = False
+            memory = self.memory.load_memory()
+            memory["rolling_summary"] = summary
+            memory["summary_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.memory.save_memory(memory)
+
+        if self.backend.remote:
+            transcript = "\n".join(f"{m['role']}: {m.get('content', '')}" for m in folded)
+            request = [
+                {"role": "system", "content": (
+                    "Update the running notes about this user for a supportive companion. "
+                    f"Keep them under {self._summary_limit() * 3 // 4} words; keep feelings, "
+                    "events, people and coping strategies that matter; drop small talk."
+                )},
+                {"role": "user", "content": f"Current notes: {previous or '(none)'}\n\nNew conversation:\n{transcript}"},
+            ]
+
+            def done(future):
+                try:
+                    summary = future.result()
+                except BaseException as e:
+                    print(f"[JerryAI] Summary request failed, summarising locally: {e!r}")
+                    summary = ""
+                apply(self._clip_summary(summary) if summary else self.local_summary(previous, folded))
+
+            self.backend.submit(request, done, timeout=self.SUMMARY_TIMEOUT, hedge=False)
+        else:
+            apply(self.local_summary(previous, folded))
+
+    def _summary_limit(self):
+        # the summary never takes more than a third of the prompt budget
+        return min(self.SUMMARY_MAX_TOKENS, self.context_token_budget // 3)
+
+    def _clip_summary(self, summary):
+        max_chars = self._summary_limit() * 4
+        return summary if len(summary) <= max_chars else "..." + summary[-max_chars:]
+
+    def local_summary(self, previous, folded):
+        # offline fallback: keep the gist of what the user said, newest last
+        notes = [
+            " ".join(m.get("content", "").split())[:120]
+            for m in folded if m.get("role") == "user" and m.get("content")
+        ]
+        combined = "; ".join(([previous] if previous else []) + notes)
+        return self._clip_summary(combined)
+
+    def run_on_ui(self, fn):
+        call_on_ui(fn)
+
+    def get_fallback_response(self, user_input):
+        return fallback_response(user_input)
+
+    def shutdown(self):
+        self.cancel_pending()
+        self.turn_queue.put(None)
+        self.backend.close()
+
+    def end_session(self):
+        if self.chat_history:
+            print("Session ended. Saving conversation to log.")
+            self.conversation_log.add_session(self.chat_history)
+            with self.chat_lock:
+                self.chat_history = []
+                self.summarized_count = 0
+                self.session_number += 1
+
+class SpriteSheet:
+    # Jerry's animation frames packed one byte per pixel (a palette index,
+    # 0 = transparent) in a single buffer, loaded once per process and shared
+    # by every animator. Identical frames are stored once; each state is a list
+    # of frame ids.
+    #
+    # File layout (little-endian): b"HSPR", version u8, width u8, height u8,
+    # frame count u16, state count u8; then per state: name length u8, name
+    # (utf-8), frame count u8, frame ids u16 each; then the frames, rows top
+    # to bottom. Built from tools/jerry_sprites.txt by tools/pack_sprites.py.
+    MAGIC = b"HSPR"
+    VERSION = 1
+    PATH = os.path.join(ASSETS_PATH, "jerry_sprites.bin")
+    _shared = None
+
+    # drawn for every state when the sheet can't be read, so a missing or
+    # corrupt asset shows a still Jerry instead of nothing
+    FALLBACK_STATES = ("content", "low_clarity", "low_insight", "low_calm", "thinking")
+    FALLBACK_FRAME = (
+        "....33333333....",
+        "..331111111133..",
+        ".31111111111113.",
+        ".31111111111113.",
+        "3111122111221113",
+        "3111122111221113",
+        "3111111111111113",
+        "3111111111111113",
+        "3111111111111113",
+        "3111111111111113",
+        ".31111111111113.",
+        ".31111111111113.",
+        "..331111111133..",
+        "....33333333....",
+        "................",
+        "................",
+    )
+
+    def __init__(self, width, height, pixels, states):
+        self.width = width
+        self.height = height
+        self.pixels = memoryview(pixels)
+        self.states = states  # name -> tuple of frame ids
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = cls.load(cls.PATH)
+        return cls._shared
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if data[:4] != cls.MAGIC or data[4] != cls.VERSION:
+                raise ValueError("not a sprite sheet")
+            width, height, frame_count, state_count = struct.unpack_from("<BBHB", data, 5)
+            offset, states = 10, {}
+            for _ in range(state_count):
+                name_length = data[offset]
+                name = data[offset + 1:offset + 1 + name_length].decode("utf-8")
+                offset += 1 + name_length
+                count = data[offset]
+                states[name] = struct.unpack_from(f"<{count}H", data, offset + 1)
+                offset += 1 + 2 * count
+            pixels = data[offset:offset + frame_count * width * height]
+            if len(pixels) != frame_count * width * height:
+                raise ValueError("truncated frame data")
+            if any(frame_id >= frame_count for frame_ids in states.values() for frame_id in frame_ids):
+                raise ValueError("frame id out of range")
+            return cls(width, height, pixels, states)
+        except Exception as e:
+            print(f"[SpriteSheet] Error loading {path}: {e}; drawing the built-in frame instead")
+            return cls.fallback()
+
+    @classmethod
+    def fallback(cls):
+        rows = cls.FALLBACK_FRAME
+        pixels = bytes(0 if p == "." else int(p) for row in rows for p in row)
+        return cls(len(rows[0]), len(rows), pixels, {name: (0,) for name in cls.FALLBACK_STATES})
+
+    @classmethod
+    def pack(cls, path, states):
+        """Write states ({name: [frame rows, ...]}) as a sprite sheet file."""
+        height = len(next(iter(states.values()))[0])
+        width = len(next(iter(states.values()))[0][0])
+        frames, ids, header = [], {}, bytearray()
+        for name, state_frames in states.items():
+            frame_ids = []
+            for rows in state_frames:
+                blob = bytes(p for row in rows for p in row)
+                if blob not in ids:
+                    ids[blob] = len(frames)
+                    frames.append(blob)
+                frame_ids.append(ids[blob])
+            encoded = name.encode("utf-8")
+            header += struct.pack("<B", len(encoded)) + encoded
+            header += struct.pack(f"<B{len(frame_ids)}H", len(frame_ids), *frame_ids)
+        with open(path, "wb") as f:
+            f.write(cls.MAGIC + struct.pack("<BBBHB", cls.VERSION, width, height, len(frames), len(states)))
+            f.write(header)
+            f.write(b"".join(frames))
+
+    def frame_count(self, state):
+        return len(self.states.get(state, ()))
+
+    def frame_id(self, state, index):
+        frame_ids = self.states.get(state)
+        return frame_ids[index % len(frame_ids)] if frame_ids else None
+
+    def frame(self, frame_id):
+        size = self.width * self.height
+        return self.pixels[frame_id * size:(frame_id + 1) * size]
+
+class ChatStream:
+    # Accumulates streamed reply text from the network thread. The Jerry screen
+    # polls it on a fixed Clock interval while it is open, so the label is
+    # re-rendered at most once per interval however fast pieces arrive. The
+    # interval only starts with the first piece (on_first_text), so replies
+    # that never stream (cached or local ones) don't poll at all.
+    def __init__(self, label=None, on_first_text=None):
+        self.label = label
+        self.parts = []
+        self.lock = threading.Lock()
+        self.rendered_length = 0
+        self.event = None
+        self.on_first_text = on_first_text  # called once, on the appending thread
+
+    def append(self, text):
+        with self.lock:
+            first = not self.parts
+            self.parts.append(text)
+        if first and self.on_first_text:
+            self.on_first_text(self)
+
+    @property
+    def text(self):
+        with self.lock:
+            return "".join(self.parts)
+
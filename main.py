@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """
-main.py — monolithic Hush app (all logic, sprites, screens, and data classes included)
+main.py — the Hush app: screens, Jerry's sprites and the KivyMD app class
 
 Notes:
-- This file contains all classes in a single module as requested.
+- This file contains the app, its screens and Jerry's rendering. Storage, the chat
+  pipeline and the companion logic live in hush_core.py, which never opens a
+  Kivy window, so tools/ and tests can import them headlessly.
 - It errs on the side of defensive checks (many hasattr checks) so the app won't crash
   immediately if parts of the UI/KV aren't present at load time.
 - The app expects a KV file (or Builder string) to create widgets with ids such as:
@@ -14,14 +16,15 @@ Notes:
 import os
 import sys
 import time
-import threading
-import math
-import json
 import random
-import openai
-from datetime import datetime
+from collections import OrderedDict
 from shutil import copyfile
 
+# Kivy parses sys.argv on import and exits on options it doesn't know, so the
+# command-line benchmarks have to switch that off before the first kivy import.
+if __name__ == "__main__" and sys.argv[1:2] == ["--benchmark-risk"]:
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+
 # --- Kivy and App Dependencies ---
 from kivymd.app import MDApp
 from kivymd.uix.label import MDLabel
@@ -51,49 +54,23 @@ from kivy.core.window import Window
 from kivy.core.audio import SoundLoader
 from kivy.utils import platform, get_hex_from_color, get_color_from_hex
 from kivy.metrics import dp
-from kivy.graphics import Color, Ellipse, Rectangle, InstructionGroup
+from kivy.graphics import Color, Ellipse, Rectangle, InstructionGroup, RenderContext
+from kivy.graphics.texture import Texture
 from kivy.lang import Builder
 from dotenv import load_dotenv
 
+from hush_core import (
+    AFFIRMATIONS, ASSETS_PATH, CBT_QUESTIONS, CHECKIN_STEPS, COGNITIVE_DISTORTIONS, DBT_QUESTIONS, DBT_SKILLS,
+    RISK_LEVELS, ChatStream, CoalescingJSONStore, JerryAI, MoodAnalytics, RiskDetector, SpriteSheet, StartupLoader,
+    UserDataTransfer, np, persistence_writer,
+)
+
 # attempt to load .env if present (harmless)
 try:
     load_dotenv()
 except Exception:
     pass
 
-# --- PATHS & BASIC SETUP ---
-ASSETS_PATH = "assets"
-
-# --- GLOBAL DATA ---
-AFFIRMATIONS = [
-    "Your feelings are valid, even the difficult ones.", "Be kind and patient with yourself today.",
-    "Each breath is a new, gentle beginning.", "It's okay to rest; you are doing enough.",
-    "You are resilient, and you can get through this moment.", "Allow yourself to simply be, without judgment."
-]
-PLAYLIST = ["01 Morning Dew.wav", "02 Serenity.wav", "04 Enchanting Table.wav", "06 Moving On.wav", "13 Return Home.wav"]
-
-CBT_QUESTIONS = [
-    {"question": "What was the situation or event that triggered the difficult feeling?", "key": "situation", "hint": "e.g., I had a disagreement with a friend."},
-    {"question": "What emotions did you feel? (e.g., sad, angry, anxious)", "key": "emotions", "hint": "List the primary emotions."},
-    {"question": "What were the automatic thoughts that went through your mind?", "key": "thoughts", "hint": "What did you immediately think or believe?"}
-]
-COGNITIVE_DISTORTIONS = {
-    "All-or-Nothing Thinking": "Viewing things in black-and-white categories.", "Overgeneralization": "Seeing a single negative event as a never-ending pattern of defeat.",
-    "Mental Filter": "Picking out a single negative detail and dwelling on it exclusively.", "Disqualifying the Positive": "Rejecting positive experiences by insisting they 'don't count'.",
-    "Jumping to Conclusions": "Making a negative interpretation despite no definite facts.", "Mind Reading": "Concluding that someone is reacting negatively to you without evidence.",
-    "Fortune Telling": "Anticipating that things will turn out badly.", "Magnification/Minimization": "Exaggerating the importance of negative things or shrinking positive things.",
-    "Emotional Reasoning": "Assuming that your negative emotions necessarily reflect the way things really are.", "Should Statements": "Motivating yourself with 'shoulds' and 'shouldn'ts'.",
-    "Labeling": "An extreme form of overgeneralization; attaching a negative label to yourself.", "Personalization": "Seeing yourself as the cause of some negative external event which you were not responsible for."
-}
-DBT_QUESTIONS = [
-    {"question": "Rate the intensity of your ANGER (0-5).", "key": "anger", "type": "rating"}, {"question": "Rate the intensity of your SADNESS (0-5).", "key": "sadness", "type": "rating"},
-    {"question": "Rate the intensity of your FEAR (0-5).", "key": "fear", "type": "rating"}, {"question": "Rate the intensity of your SHAME (0-5).", "key": "shame", "type": "rating"},
-    {"question": "Rate your urge for self-harm (0-5).", "key": "self_harm_urge", "type": "rating"}, {"question": "Rate your urge to use substances (0-5).", "key": "substance_urge", "type": "rating"},
-]
-DBT_SKILLS = {
-    "Mindfulness": ["Observe", "Describe", "Participate", "Non-judgmentally", "One-mindfully", "Effectively"], "Distress Tolerance": ["TIP", "ACCEPTS", "Self-Soothe", "IMPROVE the moment", "Radical Acceptance"],
-    "Emotion Regulation": ["Check the Facts", "Opposite Action", "Problem Solving", "ABC PLEASE"], "Interpersonal Effectiveness": ["DEAR MAN", "GIVE", "FAST"]
-}
 
 class RootWidget(FloatLayout):
     pass
@@ -103,244 +80,120 @@ class ColorProgressBar(ProgressBar):
     # RGBA color list property for the bar's fill color
     bar_color = ListProperty([1, 0, 0, 1])  # default red color
 
-class ConversationLog:
-    def __init__(self, filepath):
-        self.filepath = filepath
-
-    def load_log(self):
-        try:
-            with open(self.filepath, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
-    def add_session(self, chat_history):
-        if not chat_history:
-            return
-        log = self.load_log()
-        session = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "conversation": chat_history}
-        log.insert(0, session)
-        try:
-            with open(self.filepath, 'w') as f:
-                json.dump(log, f, indent=4)
-        except Exception as e:
-            print(f"[ConversationLog] Error saving log: {e}")
-
-class JerryMemory:
-    def __init__(self, filepath):
-        self.filepath = filepath
-
-    def load_memory(self):
-        try:
-            with open(self.filepath, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-
-    def save_memory(self, memory_dict):
-        try:
-            with open(self.filepath, 'w') as f:
-                json.dump(memory_dict, f, indent=4)
-        except Exception as e:
-            print(f"[JerryMemory] Error saving memory: {e}")
-
-class EntriesLog:
-    def __init__(self, entries_filepath):
-        self.filepath = entries_filepath
-        self.entries = self.load_entries()
-
-    def load_entries(self):
-        try:
-            with open(self.filepath, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
-    def add_entry(self, entry_type, data):
-        entry = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "type": entry_type, "data": data}
-        self.entries.insert(0, entry)
-        self.save_entries()
-
-    def save_entries(self):
-        try:
-            with open(self.filepath, 'w') as f:
-                json.dump(self.entries, f, indent=4)
-        except Exception as e:
-            print(f"[EntriesLog] Error saving entries: {e}")
-
-    def get_all_entries(self):
-        return self.entries
-
-class JerryCompanion:
-    def __init__(self, state_filepath):
-        self.state_filepath = state_filepath
-        self.needs = {"clarity": 100, "insight": 100, "calm": 100}
-        self.last_fed = {"clarity": time.time(), "insight": time.time(), "calm": time.time()}
-        self.decay_rates_hours = {"clarity": 24, "insight": 48, "calm": 12}
-        self.xp = 0
-        self.level = 1
-        self.xp_to_next_level = 100
-        self.load_state()
-
-    def load_state(self):
-        try:
-            with open(self.state_filepath, 'r') as f:
-                state = json.load(f)
-                self.needs = state.get("needs", self.needs)
-                self.last_fed = state.get("last_fed", self.last_fed)
-                self.xp = state.get("xp", self.xp)
-                self.level = state.get("level", self.level)
-                self.xp_to_next_level = state.get("xp_to_next_level", self.xp_to_next_level)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # create initial state file
-            self.save_state()
-        except Exception as e:
-            print(f"[JerryCompanion] Error loading state: {e}")
-            self.save_state()
-
-    def save_state(self):
-        try:
-            with open(self.state_filepath, 'w') as f:
-                json.dump({
-                    "needs": self.needs,
-                    "last_fed": self.last_fed,
-                    "xp": self.xp,
-                    "level": self.level,
-                    "xp_to_next_level": self.xp_to_next_level
-                }, f, indent=4)
-        except Exception as e:
-            print(f"[JerryCompanion] Error saving state: {e}")
-
-    def update_needs(self):
-        now = time.time()
-        for n, t in self.last_fed.items():
-            try:
-                decay_rate = self.decay_rates_hours.get(n, 24)
-                self.needs[n] = max(0, 100 - ((now - t) / 3600 / decay_rate) * 100)
-            except Exception:
-                self.needs[n] = self.needs.get(n, 100)
-
-    def feed(self, n, a=100):
-        self.update_needs()
-        if n in self.needs:
-            self.needs[n] = min(100, self.needs[n] + a)
-            self.last_fed[n] = time.time()
-            self.save_state()
-
-    def add_xp(self, a):
-        self.xp += a
-        if self.xp >= self.xp_to_next_level:
-            self.level_up()
-        self.save_state()
-
-    def level_up(self):
-        self.level += 1
-        self.xp -= self.xp_to_next_level
-        self.xp_to_next_level = int(self.xp_to_next_level * 1.5)
-
-class JerryAI:
-    MAX_HISTORY = 20
-
-    def __init__(self, jerry, app, conversation_log_path, jerry_memory_path, api_key=None):
-        app_dir = app.user_data_dir if hasattr(app, 'user_data_dir') else os.path.dirname(os.path.abspath(__file__))
-        state_filepath = os.path.join(app_dir, "jerry_state.json")
-        self.companion = JerryCompanion(state_filepath)
-        self.jerry = jerry
-        self.app = app
-        self.conversation_log = ConversationLog(conversation_log_path)
-        self.memory = JerryMemory(jerry_memory_path)
-        self.api_key = api_key
-        self.chat_lock = threading.Lock()
-        self.is_thinking = False
-        self.chat_history = []
-
-        if self.api_key:
-            openai.api_key = self.api_key
-            print("[JerryAI] Initialized with OpenAI support.")
-        else:
-            print("[JerryAI] No API key found — running in basic mode.")
-
-        self.system_prompt = "You are Jerry, a friendly, gentle, and supportive AI companion. Keep your responses brief and caring."
-
-    @property
-    def needs(self):
-        return self.companion.needs
-
-    def get_response_thread(self, user_input, callback):
-        def run():
-            if self.api_key:
-                try:
-                    messages = [{"role": "system", "content": self.system_prompt}] + self.chat_history
-                    response = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=messages,
-                        temperature=0.7
-                    )
-                    # compatibility: response.choices[0].message.content or response.choices[0].text
-                    ai_response = ""
-                    try:
-                        ai_response = response.choices[0].message.content.strip()
-                    except Exception:
-                        ai_response = getattr(response.choices[0], "text", "").strip()
-                        if not ai_response:
-                            ai_response = "I'm here to listen."
-                except Exception as e:
-                    print(f"[JerryAI] OpenAI error: {e}")
-                    ai_response = self.get_fallback_response(user_input)
-            else:
-                ai_response = self.get_fallback_response(user_input)
-
-            with self.chat_lock:
-                self.chat_history.append({"role": "user", "content": user_input})
-                self.chat_history.append({"role": "assistant", "content": ai_response})
-                if len(self.chat_history) > self.MAX_HISTORY:
-                    self.chat_history = self.chat_history[-self.MAX_HISTORY:]
-
-            # send response back to UI thread
-            try:
-                Clock.schedule_once(lambda dt, resp=ai_response: callback(resp))
-                Clock.schedule_once(lambda dt: setattr(self, 'is_thinking', False))
-            except Exception:
-                # fallback: call directly (dangerous, but doesn't crash)
-                try:
-                    callback(ai_response)
-                except Exception as e:
-                    print(f"[JerryAI] Callback error: {e}")
-
-        threading.Thread(target=run, daemon=True).start()
-
-    def get_fallback_response(self, user_input):
-        user_input = user_input.lower()
-        responses = {
-            "hello": "Hello! It's good to see you.",
-            "hi": "Hello! It's good to see you.",
-            "how are you": "I'm doing well, thank you! How can I help you today?",
-            "thank": "You're very welcome!",
-            "bye": "Goodbye! Have a great day!"
-        }
-        for key, value in responses.items():
-            if key in user_input:
-                return value
-        return "I'm here to listen. Tell me what's on your mind."
-
-    def end_session(self):
-        if self.chat_history:
-            print("Session ended. Saving conversation to log.")
-            self.conversation_log.add_session(self.chat_history)
-            self.chat_history = []
+class SpriteTextureCache:
+    # LRU of pre-rendered sprite frames as GPU textures. Textures must be
+    # created on the UI (GL) thread, which is the only place this is used.
+    MAX_ENTRIES = 64
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # palette index p as red = p * 51, which the sprite shader maps back to a colour
+    INDEX_COLORS = [bytes((p * 51, 0, 0, 255 if p else 0)) for p in range(5)]
+
+    @classmethod
+    def render(cls, frame, width, height, palette):
+        # frame: width * height palette indices, top row first; 0 is transparent
+        colors = [bytes((0, 0, 0, 0))] + [bytes(int(round(c * 255)) for c in rgba) for rgba in palette]
+        return cls._texture(frame, width, height, colors)
+
+    @classmethod
+    def render_indices(cls, frame, width, height):
+        return cls._texture(frame, width, height, cls.INDEX_COLORS)
+
+    @staticmethod
+    def _texture(frame, width, height, colors):
+        pixels = bytearray()
+        for y in range(height - 1, -1, -1):  # texture rows start at the bottom
+            pixels += b"".join(colors[p] for p in frame[y * width:(y + 1) * width])
+        texture = Texture.create(size=(width, height), colorfmt="rgba")
+        texture.mag_filter = "nearest"
+        texture.min_filter = "nearest"
+        texture.blit_buffer(bytes(pixels), colorfmt="rgba", bufferfmt="ubyte")
+        return texture
+
+    def get(self, key):
+        texture = self.entries.get(key)
+        if texture is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return texture
+
+    def put(self, key, texture):
+        self.entries[key] = texture
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return texture
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+sprite_textures = SpriteTextureCache()
+
+# Colours Jerry's index texture and draws the evolution aura behind him. The
+# quad extends past the sprite by the aura margin: tex coords outside 0..1 are
+# aura only. The aura pulses 0.05 -> peak -> 0.05 every 4 seconds from the
+# time uniform alone.
+JERRY_SPRITE_FS = """
+$HEADER$
+uniform float time;
+uniform vec4 body_color;
+uniform vec4 eye_color;
+uniform vec4 outline_color;
+uniform vec4 feature_color;
+uniform vec4 aura_color;
+uniform float aura_extent;
+
+void main(void) {
+    vec2 uv = tex_coord0;
+    vec4 color = vec4(0.0);
+    if (uv.x >= 0.0 && uv.x <= 1.0 && uv.y >= 0.0 && uv.y <= 1.0) {
+        float index = floor(texture2D(texture0, uv).r * 5.0 + 0.5);
+        if (index > 3.5) color = feature_color;
+        else if (index > 2.5) color = outline_color;
+        else if (index > 1.5) color = eye_color;
+        else if (index > 0.5) color = body_color;
+    }
+    if (color.a == 0.0 && aura_color.a > 0.0) {
+        float d = length(uv - vec2(0.5)) / aura_extent;
+        float pulse = 0.05 + (aura_color.a - 0.05) * (0.5 - 0.5 * cos(time * 1.5708));
+        color = vec4(aura_color.rgb, pulse * (1.0 - smoothstep(0.9, 1.0, d)));
+    }
+    gl_FragColor = color * frag_color;
+}
+"""
 
 class JerryAnimator(FloatLayout):
+    # Only ticks while the jerry screen is showing and the app is in the
+    # foreground (see set_visible / set_app_active); otherwise no Clock event
+    # is scheduled at all and the current frame is kept for when it resumes.
+    # Colours and the evolution aura are applied by JERRY_SPRITE_FS; the aura's
+    # time uniform is stepped with the sprite frames, so nothing runs per frame.
+    # Without the shader the aura is a static ellipse behind the sprite.
     anim_frame = NumericProperty(0)
     is_thinking = BooleanProperty(False)
     evolution_level = NumericProperty(0)
-    aura_color = None
+    AURA_MARGIN = 20  # px the aura reaches past the sprite on each side
 
     def __init__(self, companion=None, **kwargs):
         super().__init__(**kwargs)
         self.companion = companion
+        self.sheet = SpriteSheet.shared()
         self.anim_event = None
         self.thinking_event = None
         self.current_interval = None
+        self.anim_key = "content"
+        self.visible = False
+        self.app_active = True
+        self.render_ctx = None
+        self.shader_ok = False
+        self._palette = None
         Clock.schedule_once(self._post_init)
 
     def _post_init(self, dt):
@@ -350,152 +203,108 @@ class JerryAnimator(FloatLayout):
             if hasattr(app, 'jerry_ai'):
                 self.jerry = app.jerry_ai
             self.theme_cls = app.theme_cls
-            self._define_sprites()
 
-        self.draw_sprite(self.sprites["content"][0], "content")
+        self._build_canvas()
+        self.draw_sprite(self.anim_key, self.anim_frame)
         self.start()
 
-    def _define_sprites(self):
-        # Full sprite data, no placeholders
-        self.sprites = {
-            "content": [[[0,0,0,0,3,3,3,3,3,3,3,3,0,0,0,0],
-                         [0,0,3,3,1,1,1,1,1,1,1,1,3,3,0,0],
-                         [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                         [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                         [3,1,1,1,1,2,2,1,1,1,2,2,1,1,1,3],
-                         [3,1,1,1,1,2,2,1,1,1,2,2,1,1,1,3],
-                         [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                         [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                         [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                         [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                         [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                         [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                         [0,0,3,3,1,1,1,1,1,1,1,1,3,3,0,0],
-                         [0,0,0,0,3,3,3,3,3,3,3,3,0,0,0,0],
-                         [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                         [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]]],
-            "low_insight": [[[0,0,0,0,3,3,3,3,3,3,3,3,0,0,0,0],
-                             [0,0,3,3,1,1,1,1,1,1,1,1,3,3,0,0],
-                             [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                             [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                             [3,1,1,1,4,4,1,1,1,1,4,4,1,1,1,3],
-                             [3,1,1,1,1,4,4,1,1,4,4,1,1,1,1,3],
-                             [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                             [3,1,1,1,1,1,1,4,4,1,1,1,1,1,1,3],
-                             [3,1,1,1,1,1,4,1,1,4,1,1,1,1,1,3],
-                             [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                             [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                             [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                             [0,0,3,3,1,1,1,1,1,1,1,1,3,3,0,0],
-                             [0,0,0,0,3,3,3,3,3,3,3,3,0,0,0,0],
-                             [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                             [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]]],
-            "low_calm": [[[0,0,0,3,3,3,3,3,3,3,3,3,0,0,0,0],
-                          [0,0,3,1,1,1,1,1,1,1,1,1,3,0,0,0],
-                          [0,3,1,1,1,1,1,1,1,1,1,1,1,3,0,0],
-                          [3,1,1,1,4,4,1,1,1,4,4,1,1,1,3,0],
-                          [3,1,1,1,4,4,1,1,1,4,4,1,1,1,3,3],
-                          [3,1,1,1,1,1,1,1,1,1,1,1,1,1,1,3],
-                          [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                          [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                          [0,3,1,1,1,1,1,1,1,1,1,1,1,1,3,0],
-                          [0,3,1,1,1,1,1,1,1,1,1,1,1,3,0,0],
-                          [0,0,3,1,1,1,1,1,1,1,1,1,3,0,0,0],
-                          [0,0,0,3,3,3,3,3,3,3,3,3,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]]],
-            "thinking": [[[0,0,0,0,0,0,0,0,0,3,3,3,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,3,1,1,1,3,0,0,0],
-                          [0,0,0,0,0,0,0,3,1,1,1,1,1,3,0,0],
-                          [0,0,0,0,0,0,0,3,1,2,0,2,1,1,3,0],
-                          [0,0,0,0,0,0,3,1,1,1,1,1,1,1,3,0],
-                          [0,0,0,0,0,3,1,1,1,1,1,1,1,3,0,0],
-                          [0,0,0,0,0,0,3,3,3,3,3,3,3,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0],
-                          [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]]]
-        }
-
-        self.sprites["low_clarity"] = self.sprites["content"]
+    def _build_canvas(self):
+        self.render_ctx = RenderContext(use_parent_projection=True, use_parent_modelview=True,
+                                        use_parent_frag_modelview=True)
+        self.render_ctx.shader.fs = JERRY_SPRITE_FS
+        self.shader_ok = bool(self.render_ctx.shader.success)
+        if self.shader_ok:
+            self.render_ctx['time'] = 0.0
+        else:
+            print("[JerryAnimator] Sprite shader unavailable, colouring sprites on the CPU")
+            self.render_ctx = InstructionGroup()
+            self._aura_color = Color(0, 0, 0, 0)
+            self._aura_ellipse = Ellipse()
+            self.render_ctx.add(self._aura_color)
+            self.render_ctx.add(self._aura_ellipse)
+        self._sprite_rect = Rectangle()
+        self.render_ctx.add(Color(1, 1, 1, 1))
+        self.render_ctx.add(self._sprite_rect)
+        self.canvas.add(self.render_ctx)
+        self.bind(size=self._layout_sprite, pos=self._layout_sprite)
+
+    def set_visible(self, visible):
+        # the jerry screen was entered (True) or left (False)
+        self.visible = visible
+        if visible and self.companion is None:
+            jerry_ai = getattr(getattr(self, 'app', None), 'jerry_ai', None)
+            self.companion = getattr(jerry_ai, 'companion', None)
+        self._update_schedule()
+
+    def set_app_active(self, active):
+        # app resumed (True) or paused (False)
+        self.app_active = active
+        self._update_schedule()
+
+    def _update_schedule(self):
+        wanted = self.visible and self.app_active and self.current_interval is not None
+        if wanted and self.anim_event is None:
+            self.draw_sprite(self.anim_key, self.anim_frame)
+            self.anim_event = Clock.schedule_interval(self._auto_animate, self.current_interval)
+        elif not wanted and self.anim_event is not None:
+            self.anim_event.cancel()
+            self.anim_event = None
+
+    def aura_params(self):
+        # (r, g, b, peak alpha) of the aura for the evolution level, or None
+        if self.evolution_level >= 20:
+            return (1, 0.8, 0.2, 0.35)
+        if self.evolution_level >= 10:
+            return (0.5, 0.8, 1, 0.2)
+        if self.evolution_level >= 5:
+            return (0.3, 0.6, 1, 0.15)
+        return None
 
     def evolve(self, level):
+        # palette and aura are shader uniforms, so a new level just redraws
         self.evolution_level = level
-        if self.aura_color:
-            try:
-                Animation.cancel_all(self.aura_color)
-            except Exception:
-                pass
-            self.aura_color = None
-
-        # Aura colors for each level
-        if self.evolution_level >= 5:
-            self.start_aura_animation(max_alpha=0.15, color=(0.3,0.6,1))
-        if self.evolution_level >= 10:
-            self.start_aura_animation(max_alpha=0.2, color=(0.5,0.8,1))
-        if self.evolution_level >= 20:
-            self.start_aura_animation(max_alpha=0.35, color=(1,0.8,0.2))
-
-    def start_aura_animation(self, max_alpha=0.2, color=(0.5,0.8,1)):
-        self.aura_color = Color(rgba=(color[0], color[1], color[2], 0))
-        anim = Animation(a=max_alpha, d=2) + Animation(a=0.05, d=2)
-        anim.repeat = True
-        anim.start(self.aura_color)
+        self.draw_sprite(self.anim_key, self.anim_frame)
 
     def start(self):
+        # ticking begins (or resumes) once the animator is visible and the app active
         self.stop()
         self.is_thinking = False
         self.current_interval = 0.35
-        self.anim_event = Clock.schedule_interval(self._auto_animate, self.current_interval)
+        self._update_schedule()
 
     def stop(self):
         try:
-            if self.anim_event:
-                self.anim_event.cancel()
-                self.anim_event = None
-            if self.thinking_event:
-                self.thinking_event.cancel()
-                self.thinking_event = None
-            if self.aura_color:
-                try:
-                    Animation.cancel_all(self.aura_color)
-                except Exception:
-                    pass
-                self.aura_color = None
+            for name in ('anim_event', 'thinking_event'):
+                event = getattr(self, name)
+                if event:
+                    event.cancel()
+                    setattr(self, name, None)
         except Exception as e:
             print(f"[JerryAnimator] stop error: {e}")
 
     def _auto_animate(self, dt):
         try:
-            if self.is_thinking:
-                frames = self.sprites.get("thinking", [])
-                if frames:
-                    self.anim_frame = (self.anim_frame + 1) % len(frames)
-                    self.draw_sprite(frames[self.anim_frame], "thinking")
-                return
-
             anim_key = "content"
             new_interval = 0.35
 
-            if self.companion:
-                self.companion.update_needs()
+            if self.is_thinking:
+                anim_key = "thinking"
+            elif self.companion:
+                # needs are refreshed by the app's minute timer; reading them is enough here
                 needs = self.companion.needs
                 if needs:
                     min_need = min(needs, key=needs.get)
                     anim_key = f"low_{min_need}" if needs[min_need] < 50 else "content"
                     new_interval = 0.15 if anim_key == "low_calm" else 0.35
 
-            if anim_key in self.sprites:
-                frames = self.sprites[anim_key]
-                self.anim_frame = (self.anim_frame + 1) % len(frames)
-                self.draw_sprite(frames[self.anim_frame], anim_key)
+            frames = self.sheet.frame_count(anim_key)
+            if frames:
+                if anim_key != self.anim_key:
+                    self.anim_key = anim_key
+                    self.anim_frame = 0
+                else:
+                    self.anim_frame = (self.anim_frame + 1) % frames
+                self.draw_sprite(anim_key, self.anim_frame)
 
             if self.anim_event and abs(new_interval - self.current_interval) > 0.01:
                 self.anim_event.cancel()
@@ -505,14 +314,8 @@ class JerryAnimator(FloatLayout):
         except Exception as e:
             print(f"[JerryAnimator] auto_animate error: {e}")
 
-    def draw_sprite(self, data, anim_key):
-        if not data or self.width == 0 or self.height == 0:
-            return
-
-        pixel_size = self.width / 18
-        offset_x = (Window.width - (16 * pixel_size)) / 2
-        offset_y = (Window.height - (16 * pixel_size) - 20)
-
+    def sprite_palette(self, anim_key):
+        # colours for pixel values 1-4: body, eye, outline, feature
         body_c = (0.3, 0.6, 0.9, 1)
         outline_c = (0.5, 0.8, 1.0, 1)
         eye_c = (1, 1, 1, 1)
@@ -531,44 +334,59 @@ class JerryAnimator(FloatLayout):
             # Fully evolved visual tweak
             body_c = (1, 0.9, 0.3, 1)
             feature_c = (1, 0.6, 0.2, 1)
+        return body_c, eye_c, outline_c, feature_c
+
+    def draw_sprite(self, anim_key, frame=0):
+        # One textured Rectangle per frame. With the shader the texture holds
+        # palette indices (one per frame, shared by every palette) and colours
+        # are uniforms; without it each palette gets its own coloured texture.
+        frame_id = self.sheet.frame_id(anim_key, frame)
+        if frame_id is None or self.render_ctx is None or self.width == 0 or self.height == 0:
+            return
 
-        if not hasattr(self, '_sprite_instructions'):
-            self._sprite_instructions = InstructionGroup()
-            self.canvas.add(self._sprite_instructions)
-        self._sprite_instructions.clear()
-
-        if self.evolution_level >= 2 and self.aura_color:
-            try:
-                self._sprite_instructions.add(self.aura_color)
-            except Exception:
-                pass
-            aura_size = (16 * pixel_size + 40, 16 * pixel_size + 40)
-            aura_pos = (offset_x - 20, offset_y - 20)
-            self._sprite_instructions.add(Ellipse(pos=aura_pos, size=aura_size))
-
-        for y, row in enumerate(data):
-            for x, p in enumerate(row):
-                if p > 0:
-                    if p == 1:
-                        self._sprite_instructions.add(Color(*body_c))
-                    elif p == 2:
-                        self._sprite_instructions.add(Color(*eye_c))
-                    elif p == 3:
-                        self._sprite_instructions.add(Color(*outline_c))
-                    elif p == 4:
-                        self._sprite_instructions.add(Color(*feature_c))
-                    self._sprite_instructions.add(Rectangle(
-                        pos=(x * pixel_size + offset_x, self.height - (y + 1) * pixel_size - 20),
-                        size=(pixel_size, pixel_size)
-                    ))
-
-        if not hasattr(self, '_sprite_bound'):
-            self.bind(size=lambda *a: self.draw_sprite(data, anim_key))
-            self.bind(pos=lambda *a: self.draw_sprite(data, anim_key))
-            self._sprite_bound = True
+        palette = self.sprite_palette(anim_key)
+        key = ("indices", frame_id) if self.shader_ok else (frame_id, palette)
+        texture = sprite_textures.get(key)
+        if texture is None:
+            pixels = self.sheet.frame(frame_id)
+            if self.shader_ok:
+                texture = SpriteTextureCache.render_indices(pixels, self.sheet.width, self.sheet.height)
+            else:
+                texture = SpriteTextureCache.render(pixels, self.sheet.width, self.sheet.height, palette)
+            sprite_textures.put(key, texture)
+        if self.shader_ok and palette != self._palette:
+            for name, rgba in zip(("body_color", "eye_color", "outline_color", "feature_color"), palette):
+                self.render_ctx[name] = [float(c) for c in rgba]
+            self._palette = palette
+        if self.shader_ok:
+            # the aura pulse advances once per sprite frame rather than every frame
+            self.render_ctx['time'] = Clock.get_boottime()
+
+        self._sprite_rect.texture = texture
+        self._layout_sprite()
+
+    def _layout_sprite(self, *args):
+        size = 16 * self.width / 18
+        x, y = (Window.width - size) / 2, self.height - size - 20
+        aura = self.aura_params() if self.shader_ok else None
+        margin = self.AURA_MARGIN if aura else 0
+        self._sprite_rect.pos = (x - margin, y - margin)
+        self._sprite_rect.size = (size + 2 * margin, size + 2 * margin)
+        # the sprite keeps tex coords 0..1; the margin maps outside that range
+        k = margin / size if size else 0
+        self._sprite_rect.tex_coords = (-k, -k, 1 + k, -k, 1 + k, 1 + k, -k, 1 + k)
+        if self.shader_ok:
+            self.render_ctx['aura_color'] = [float(c) for c in aura] if aura else [0.0, 0.0, 0.0, 0.0]
+            self.render_ctx['aura_extent'] = 0.5 + k
+        else:
+            aura = self.aura_params()
+            self._aura_color.rgba = aura if aura else (0, 0, 0, 0)
+            self._aura_ellipse.pos = (x - self.AURA_MARGIN, y - self.AURA_MARGIN)
+            self._aura_ellipse.size = (size + 2 * self.AURA_MARGIN, size + 2 * self.AURA_MARGIN)
 
-      
 class SplashScreen(Screen):
+    SPLASH_SECONDS = 2
+
     def on_enter(self):
         layout = BoxLayout()
         # Check if splash image exists, use placeholder if not
@@ -584,9 +402,17 @@ class SplashScreen(Screen):
         layout.add_widget(splash)
         self.add_widget(layout)
 
-        Clock.schedule_once(self.go_to_jerry, 2)
+        # the placeholder splash already counted towards the time shown
+        app = MDApp.get_running_app()
+        shown = time.monotonic() - getattr(app, 'launch_time', time.monotonic())
+        Clock.schedule_once(self.go_to_jerry, max(0, self.SPLASH_SECONDS - shown))
 
     def go_to_jerry(self, dt):
+        # hold the splash until the startup snapshot has been applied
+        app = MDApp.get_running_app()
+        if app and getattr(app, 'startup_snapshot', None) is None and getattr(app, 'startup_loader', None):
+            Clock.schedule_once(self.go_to_jerry, 0.1)
+            return
         if self.manager:
             try:
                 self.manager.transition = FadeTransition(duration=0.5)
@@ -596,15 +422,19 @@ class SplashScreen(Screen):
 
 class JerryScreen(Screen):
     last_known_level = NumericProperty(0)
+    STREAM_FLUSH_INTERVAL = 0.05
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.jerry_ai = None
+        self.active_streams = []
 
     def on_enter(self):
         app = MDApp.get_running_app()
         if app and hasattr(app, 'jerry_ai'):
             self.jerry_ai = app.jerry_ai
+        if hasattr(self.ids, 'animator'):
+            self.ids.animator.set_visible(True)
 
         Clock.schedule_once(self.setup_screen)
 
@@ -624,6 +454,14 @@ class JerryScreen(Screen):
         if app and hasattr(app, 'update_affirmation_banner'):
             app.update_affirmation_banner(self.name)
 
+    def on_leave(self):
+        if hasattr(self.ids, 'animator'):
+            self.ids.animator.set_visible(False)
+        if self.jerry_ai:
+            self.jerry_ai.cancel_pending()
+        for stream in list(self.active_streams):
+            self.end_stream(stream)
+
     def update_needs(self):
         if self.jerry_ai and hasattr(self.jerry_ai, 'companion'):
             self.jerry_ai.companion.update_needs()
@@ -690,20 +528,75 @@ class JerryScreen(Screen):
         self.add_message("You", user_text)
         self.ids.user_entry.text = ""
 
+        app = MDApp.get_running_app()
+        if app and hasattr(app, 'check_risk'):
+            app.check_risk("jerry", user_text)
+
         if self.jerry_ai:
-            self.jerry_ai.get_response_thread(user_text, self.handle_ai_response)
+            stream = self.begin_stream()
+            self.jerry_ai.get_response_thread(
+                user_text, lambda response, s=stream: self.handle_ai_response(response, s), stream=stream
+            )
 
-    def handle_ai_response(self, response):
+    def begin_stream(self):
+        stream = ChatStream(on_first_text=lambda s: Clock.schedule_once(lambda dt: self.start_flushing(s)))
+        self.active_streams.append(stream)
+        return stream
+
+    def start_flushing(self, stream):
+        # the reply may already have been handled by the time this runs
+        if stream in self.active_streams and stream.event is None:
+            stream.event = Clock.schedule_interval(lambda dt: self.flush_stream(stream), self.STREAM_FLUSH_INTERVAL)
+            self.flush_stream(stream)
+
+    def flush_stream(self, stream):
+        text = stream.text
+        # "ACTION:" replies navigate instead of showing, so a reply that is or
+        # may still become one ("AC", "ACTIO") is held back until it can't
+        if len(text) == stream.rendered_length or text.startswith("ACTION:") or "ACTION:".startswith(text):
+            return
+        stream.rendered_length = len(text)
+        if stream.label is None:
+            stream.label = self.add_message("Jerry", text)
+        else:
+            stream.label.text = self.format_message("Jerry", text)
+            self.scroll_to_bottom()
+
+    def end_stream(self, stream):
+        if stream.event:
+            stream.event.cancel()
+            stream.event = None
+        if stream in self.active_streams:
+            self.active_streams.remove(stream)
+
+    def handle_ai_response(self, response, stream=None):
         try:
+            if stream:
+                self.end_stream(stream)
+            if response is None:
+                # merged into a later message's reply
+                if stream and stream.label is not None and hasattr(self.ids, 'chat_log'):
+                    self.ids.chat_log.remove_widget(stream.label)
+                return
             if response.startswith("ACTION:"):
+                if stream and stream.label is not None and hasattr(self.ids, 'chat_log'):
+                    self.ids.chat_log.remove_widget(stream.label)
                 app = MDApp.get_running_app()
                 if app and hasattr(app, 'root') and hasattr(app.root, 'ids') and 'sm' in app.root.ids:
                     app.root.ids.sm.current = response.split(":", 1)[1].strip()
+            elif stream and stream.label is not None:
+                stream.label.text = self.format_message("Jerry", response)
+                self.scroll_to_bottom()
             else:
                 self.add_message("Jerry", response)
         except Exception as e:
             print(f"[JerryScreen] handle_ai_response error: {e}")
 
+    def format_message(self, speaker, message):
+        app = MDApp.get_running_app()
+        speaker_color = app.theme_cls.primary_color if speaker == 'Jerry' else app.theme_cls.accent_color
+        return f"[b][color={get_hex_from_color(speaker_color)}]{speaker}:[/color][/b] {message}"
+
     def add_message(self, speaker, message):
         if not hasattr(self, 'ids') or not hasattr(self.ids, 'chat_log'):
             return
@@ -712,11 +605,9 @@ class JerryScreen(Screen):
         if not app:
             return
 
-        speaker_color = app.theme_cls.primary_color if speaker == 'Jerry' else app.theme_cls.accent_color
-
         try:
             message_label = MDLabel(
-                text=f"[b][color={get_hex_from_color(speaker_color)}]{speaker}:[/color][/b] {message}",
+                text=self.format_message(speaker, message),
                 markup=True,
                 size_hint_y=None,
                 theme_text_color="Primary",
@@ -730,6 +621,7 @@ class JerryScreen(Screen):
 
             self.ids.chat_log.add_widget(message_label)
             self.scroll_to_bottom()
+            return message_label
         except Exception as e:
             print(f"[JerryScreen] add_message error: {e}")
 
@@ -825,11 +717,7 @@ class CheckinScreen(Screen):
 
             theme_cls = app.theme_cls
 
-            steps = [
-                ("How are you feeling emotionally?", ["Good", "Okay", "Bad"], "emotion"),
-                ("How is your body feeling?", ["Energetic", "Tired", "Pain"], "physical"),
-                ("How is your mind today?", ["Clear", "Foggy", "Overwhelmed"], "mental")
-            ]
+            steps = CHECKIN_STEPS
 
             if self.checkin_step >= len(steps):
                 self.complete_checkin()
@@ -1042,6 +930,8 @@ class TherapyScreenBase(Screen):
             return
 
         try:
+            if hasattr(app, 'check_risk'):
+                app.check_risk(self.entry_type, " \n".join(v for v in self.flow_data.values() if isinstance(v, str)))
             if hasattr(app, 'entries_log'):
                 app.entries_log.add_entry(self.entry_type, self.flow_data)
 
@@ -1097,25 +987,88 @@ class EntriesScreen(Screen):
 class HistoryScreen(Screen):
     # store history items as a list of strings
     history = ListProperty([])
+    # sessions are paged in from the conversation log as the user scrolls down
+    LOAD_MORE_AT = 0.05
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pager = None
+        self.loading_page = False
+
+    def on_enter(self):
+        app = MDApp.get_running_app()
+        if app and hasattr(app, 'update_affirmation_banner'):
+            app.update_affirmation_banner(self.name)
+        self.open_history()
+
+    def on_leave(self):
+        if self.pager:
+            self.pager.close()
+            self.pager = None
+
+    def open_history(self):
+        if not hasattr(self, 'ids') or not hasattr(self.ids, 'history_text'):
+            return
+        app = MDApp.get_running_app()
+        jerry_ai = getattr(app, 'jerry_ai', None) if app else None
+        if not jerry_ai or not hasattr(jerry_ai, 'conversation_log'):
+            return
+
+        try:
+            if self.pager:
+                self.pager.close()
+            self.pager = jerry_ai.conversation_log.open_pager()
+            self.history = []
+            self.ids.history_text.clear_widgets()
+            if hasattr(self.ids, 'history_scroller'):
+                self.ids.history_scroller.unbind(scroll_y=self.on_history_scroll)
+                self.ids.history_scroller.scroll_y = 1
+                self.ids.history_scroller.bind(scroll_y=self.on_history_scroll)
+            self.load_next_page()
+        except Exception as e:
+            print(f"[HistoryScreen] open_history error: {e}")
+
+    def on_history_scroll(self, scroller, scroll_y):
+        if scroll_y <= self.LOAD_MORE_AT and not self.loading_page and self.pager and self.pager.has_more:
+            self.loading_page = True
+            Clock.schedule_once(lambda dt: self.load_next_page())
+
+    def load_next_page(self):
+        try:
+            if not self.pager:
+                return
+            for session in self.pager.next_page():
+                self.add_history(f"[b]{session.get('timestamp', '')}[/b]")
+                for message in session.get("conversation", []):
+                    speaker = "You" if message.get("role") == "user" else "Jerry"
+                    self.add_history(f"{speaker}: {message.get('content', '')}")
+        except Exception as e:
+            print(f"[HistoryScreen] load_next_page error: {e}")
+        finally:
+            self.loading_page = False
 
     def add_history(self, text):
         """Add a new conversation history line dynamically."""
         if text.strip():
             self.history.append(text.strip())
-            self.update_history_display()
+            self._add_history_label(text.strip())
+
+    def _add_history_label(self, line):
+        from kivymd.uix.label import MDLabel
+        self.ids.history_text.add_widget(MDLabel(
+            text=line,
+            markup=True,
+            theme_text_color="Custom",
+            text_color=self.theme_cls.text_color,
+            halign="left",
+            adaptive_height=True
+        ))
 
     def update_history_display(self):
         container = self.ids.history_text
         container.clear_widgets()
-        from kivymd.uix.label import MDLabel
         for line in self.history:
-            container.add_widget(MDLabel(
-                text=line,
-                theme_text_color="Custom",
-                text_color=self.theme_cls.text_color,
-                halign="left",
-                adaptive_height=True
-            ))
+            self._add_history_label(line)
 
 class HushScreen(Screen):
   timer_active = BooleanProperty(False)
@@ -1159,7 +1112,10 @@ class HushScreen(Screen):
 # --- MAIN APP CLASS ---
 class HushApp(MDApp):
     dialog = None
+    risk_dialog = None
+    RISK_DIALOG_COOLDOWN = 600  # seconds before the same or a lower level is shown again
     affirmation_text = StringProperty("")
+    cache_replies = BooleanProperty(False)  # keep Jerry's cached replies on disk between launches
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -1170,12 +1126,18 @@ class HushApp(MDApp):
             pass
         self.setup_completed = False
         self.font_size_multiplier = 1.0
+        self.settings_store = None
         # default theme settings (will be overridden by load_settings)
         try:
             self.theme_cls.theme_style = "Dark"
         except Exception:
             pass
         self.api_key = ""
+        self.chat_backend = ""
+        self.chat_base_url = ""
+        self.chat_model = ""
+        self.risk_detector = RiskDetector()
+        self.last_risk_alert = (None, 0)
 
     def build(self):
         # Set up theme defaults
@@ -1185,63 +1147,102 @@ class HushApp(MDApp):
         except Exception:
             pass
 
-        # load settings (uses self.user_data_dir)
-        self.load_settings()
+        # settings and the stores are read off the UI thread by StartupLoader (see on_start).
+        # RootWidget is only created once the saved theme has been applied (see
+        # _on_startup_snapshot); until then the splash image stands in for it.
+        self.launch_time = time.monotonic()
+        return self.splash_placeholder()
 
-        # Return RootWidget — make sure your KV or Python creates expected child widgets (screen manager etc.)
-        return RootWidget()
+    def splash_placeholder(self):
+        path = os.path.join(ASSETS_PATH, 'new_splash.png')
+        if os.path.exists(path):
+            return Image(source=path, allow_stretch=True, keep_ratio=False)
+        return Label(text='HUSH\nLoading...', font_size='24sp', halign='center')
 
-    def load_settings(self):
+    def settings_path(self):
         # user_data_dir should exist (MDApp provides it). Use fallback if not present.
         try:
-            settings_path = os.path.join(self.user_data_dir, "app_settings.json")
+            return os.path.join(self.user_data_dir, "app_settings.json")
         except Exception:
-            settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_settings.json")
+            return os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_settings.json")
 
-        if not os.path.exists(settings_path):
-            self.save_settings()
-            return
+    def load_settings(self):
+        self.apply_settings(StartupLoader._read_json(self.settings_path()))
 
-        try:
-            with open(settings_path, "r") as f:
-                settings = json.load(f)
-                try:
-                    self.theme_cls.theme_style = settings.get("theme_style", "Dark")
-                except Exception:
-                    pass
-                self.set_font_size(settings.get("font_size", 1.0))
-                self.api_key = settings.get("HUSHOS_API_KEY", "")
-                self.setup_completed = settings.get("setup_completed", False)
-        except (FileNotFoundError, json.JSONDecodeError):
+    def apply_settings(self, settings):
+        # settings is the parsed app_settings.json, or None if missing/unreadable
+        if settings is None:
             self.font_size_multiplier = 1.0
             try:
                 self.theme_cls.theme_style = "Dark"
             except Exception:
                 pass
             self.api_key = ""
+            self.cache_replies = False
             self.setup_completed = False
             self.save_settings()
+            return
+
+        try:
+            try:
+                self.theme_cls.theme_style = settings.get("theme_style", "Dark")
+            except Exception:
+                pass
+            # applying loaded values must not write the file we're reading
+            self.set_font_size(settings.get("font_size", 1.0), save=False)
+            self.api_key = settings.get("HUSHOS_API_KEY", "")
+            self.chat_backend = settings.get("CHAT_BACKEND", "")
+            self.chat_base_url = settings.get("CHAT_BASE_URL", "")
+            self.chat_model = settings.get("CHAT_MODEL", "")
+            self.cache_replies = bool(settings.get("CACHE_REPLIES", False))
+            self.setup_completed = settings.get("setup_completed", False)
         except Exception as e:
             print(f"[HushApp] load_settings unexpected error: {e}")
 
-    def save_settings(self):
-        try:
-            settings_path = os.path.join(self.user_data_dir, "app_settings.json")
-        except Exception:
-            settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_settings.json")
+    def snapshot_settings(self):
+        return {
+            "theme_style": getattr(self.theme_cls, "theme_style", "Dark"),
+            "font_size": self.font_size_multiplier,
+            "HUSHOS_API_KEY": self.api_key,
+            "CHAT_BACKEND": self.chat_backend,
+            "CHAT_BASE_URL": self.chat_base_url,
+            "CHAT_MODEL": self.chat_model,
+            "CACHE_REPLIES": self.cache_replies,
+            "setup_completed": self.setup_completed,
+        }
 
+    def save_settings(self):
         try:
-            settings = {
-                "theme_style": getattr(self.theme_cls, "theme_style", "Dark"),
-                "font_size": self.font_size_multiplier,
-                "HUSHOS_API_KEY": self.api_key,
-                "setup_completed": self.setup_completed,
-            }
-            with open(settings_path, "w") as f:
-                json.dump(settings, f, indent=4)
+            if self.settings_store is None:
+                self.settings_store = CoalescingJSONStore(self.settings_path(), self.snapshot_settings)
+            self.settings_store.save()
         except Exception as e:
             print(f"[HushApp] Error saving settings: {e}")
 
+    def chat_backend_options(self):
+        # HUSHOS_CHAT_* environment variables (or .env) override the saved settings
+        return {
+            "kind": os.environ.get("HUSHOS_CHAT_BACKEND") or self.chat_backend or None,
+            "base_url": os.environ.get("HUSHOS_CHAT_BASE_URL") or self.chat_base_url or None,
+            "model": os.environ.get("HUSHOS_CHAT_MODEL") or self.chat_model or None,
+        }
+
+    def flush_state(self):
+        # Push any pending coalesced writes to disk (called on stop/pause).
+        stores = [self.settings_store]
+        if getattr(self, "jerry_ai", None) and hasattr(self.jerry_ai, "companion"):
+            stores.append(self.jerry_ai.companion.store)
+            stores.append(self.jerry_ai.response_cache.store)  # None unless CACHE_REPLIES
+        for store in stores:
+            if store is None:
+                continue
+            try:
+                store.flush()
+                print(f"[HushApp] {store.stats()}")
+            except Exception as e:
+                print(f"[HushApp] flush_state error: {e}")
+        persistence_writer.flush()
+
     def toggle_theme_style(self):
         try:
             current = getattr(self.theme_cls, "theme_style", "Dark")
@@ -1250,10 +1251,24 @@ class HushApp(MDApp):
         except Exception as e:
             print(f"[HushApp] toggle_theme_style error: {e}")
 
-    def set_font_size(self, multiplier):
+    def set_cache_replies(self, active):
         try:
-            self.font_size_multiplier = float(multiplier)
+            active = bool(active)
+            if active == self.cache_replies:
+                return
+            self.cache_replies = active
             self.save_settings()
+            if getattr(self, "jerry_ai", None):
+                path = self.startup_loader.response_cache_path
+                self.jerry_ai.response_cache.set_filepath(path if active else None)
+        except Exception as e:
+            print(f"[HushApp] set_cache_replies error: {e}")
+
+    def set_font_size(self, multiplier, save=True):
+        try:
+            self.font_size_multiplier = float(multiplier)
+            if save:
+                self.save_settings()
         except Exception as e:
             print(f"[HushApp] set_font_size error: {e}")
 
@@ -1263,9 +1278,8 @@ class HushApp(MDApp):
             self.setup_completed = True
             self.save_settings()
             if hasattr(self, "jerry_ai") and self.jerry_ai:
-                self.jerry_ai.api_key = self.api_key
-                if self.api_key:
-                    openai.api_key = self.api_key
+                self.jerry_ai.set_api_key(self.api_key)
+                self.jerry_ai.warm_up()
         except Exception as e:
             print(f"[HushApp] set_api_key error: {e}")
           
@@ -1273,44 +1287,59 @@ class HushApp(MDApp):
       Clock.schedule_once(self._delayed_on_start, 0)
       
     def _delayed_on_start(self, dt):
+      base_dir = getattr(self, 'user_data_dir', None)
+      if not base_dir:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+
+      self.startup_snapshot = None
+      self.startup_loader = StartupLoader(base_dir, self.settings_path())
+      self.conversation_log_path = self.startup_loader.conversation_log_path
+      self.jerry_memory_path = self.startup_loader.jerry_memory_path
+      self.entries_filepath = self.startup_loader.entries_filepath
+      # screens are wired up in _on_startup_snapshot once every store has been read
+      self.startup_loader.load_async(self._on_startup_snapshot)
+
+    def _on_startup_snapshot(self, snapshot):
       sm = None
       try:
-        base_dir = getattr(self, 'user_data_dir', None)
-        if not base_dir:
-          base_dir = os.path.dirname(os.path.abspath(__file__))
-          
-          self.conversation_log_path = os.path.join(base_dir, "conversation_log.json")
-          self.jerry_memory_path = os.path.join(base_dir, "jerry_memory.json")
-          self.entries_filepath = os.path.join(base_dir, "entries.json")
-          self.entries_log = EntriesLog(self.entries_filepath)
-          
-          # Safely add screens if screen manager exists in root ids
-          sm = getattr(self.root.ids, "sm", None)
-          if sm:
-            existing_names = {w.name for w in sm.children if hasattr(w, 'name')}
-            screens_to_add = [
-              (SettingsScreen, "settings"),
-              (CheckinScreen, "checkin"),
-              (CBTFlowScreen, "cbt_flow"),
-              (DBTFlowScreen, "dbt_flow"),
-            ]
-            for screen_cls, name in screens_to_add:
-              if name not in existing_names:
-                sm.add_widget(screen_cls(name=name))
-              
+        print(f"[HushApp] Startup load timings (ms): {dict(snapshot.timings)}")
+        self.apply_settings(snapshot.settings)
+        self.search_index = snapshot.search_index
+        self.entries_log = snapshot.entries_log
+
+        # build the UI only now, so it first renders in the saved theme
+        placeholder, self.root = self.root, RootWidget()
+        Window.remove_widget(placeholder)
+        Window.add_widget(self.root)
+
+        # Safely add screens if screen manager exists in root ids
+        sm = getattr(self.root.ids, "sm", None)
+        if sm:
+          existing_names = {w.name for w in sm.children if hasattr(w, 'name')}
+          screens_to_add = [
+            (SettingsScreen, "settings"),
+            (CheckinScreen, "checkin"),
+            (CBTFlowScreen, "cbt_flow"),
+            (DBTFlowScreen, "dbt_flow"),
+          ]
+          for screen_cls, name in screens_to_add:
+            if name not in existing_names:
+              sm.add_widget(screen_cls(name=name))
+
         # Initialize JerryAI with safe access to animator
-        jerry_animator = None
-        js = getattr(self.root.ids, "jerry_screen", None)
-        if js:
-          jerry_animator = getattr(js.ids, "animator", None)
-          self.jerry_ai = JerryAI(
-            jerry_animator,
-            self,
-            self.conversation_log_path,
-            self.jerry_memory_path,
-            getattr(self, 'api_key', None),
-          )
-          
+        self.jerry_ai = JerryAI(
+          self.jerry_animator(),
+          self,
+          self.conversation_log_path,
+          self.jerry_memory_path,
+          getattr(self, 'api_key', None),
+          startup=snapshot,
+          backend_options=self.chat_backend_options(),
+        )
+        # connect while the splash is still up so the first reply doesn't pay for DNS/TLS
+        self.jerry_ai.warm_up()
+        self.startup_snapshot = snapshot
+
         # Decide startup screen
         if not getattr(self, 'setup_completed', False):
           if sm:
@@ -1318,33 +1347,53 @@ class HushApp(MDApp):
             for w in sm.children:
               if getattr(w, 'name', '') == 'settings':
                 setattr(w, 'is_first_setup', True)
-              
-              else:
-                if sm:
-                  sm.current = "jerry"
-                  
+
         # Schedule Jerry updates
         if hasattr(self, "jerry_ai") and self.jerry_ai:
           Clock.schedule_interval(lambda dt: self.jerry_ai.companion.update_needs(), 60)
-          
+
           Clock.schedule_interval(lambda dt: self.update_affirmation_banner(), 10)
-          
+
           if sm:
             try:
               self.update_affirmation_banner(sm.current)
             except Exception as e:
               print(f"[HushApp] Error in on_start: {e}")
-            
+
       except Exception as e:
-        print(f"[HushApp] _delayed_on_start error: {e}")
-        
+        print(f"[HushApp] _on_startup_snapshot error: {e}")
+
     def on_stop(self):
       try:
         if hasattr(self, "jerry_ai"):
           self.jerry_ai.end_session()
+          self.jerry_ai.shutdown()
       except Exception as e:
         print(f"[HushApp] on_stop error: {e}")
         # Let the OS manage window closing and lifecycle
+      self.flush_state()
+
+    def jerry_animator(self):
+      try:
+        return self.root.ids.sm.get_screen('jerry').ids.animator
+      except Exception:
+        return None
+
+    def on_pause(self):
+      # Android may kill a paused app without calling on_stop
+      animator = self.jerry_animator()
+      if animator:
+        animator.set_app_active(False)
+      self.flush_state()
+      return True
+
+    def on_resume(self):
+      animator = self.jerry_animator()
+      if animator:
+        animator.set_app_active(True)
+      # sockets rarely survive a pause on mobile; reconnect before the user types
+      if getattr(self, "jerry_ai", None):
+        self.jerry_ai.warm_up()
 
        
     def update_affirmation_banner(self, screen_name=None):
@@ -1387,6 +1436,48 @@ class HushApp(MDApp):
         except Exception as e:
             print(f"[HushApp] show_exit_dialog error: {e}")
 
+    def check_risk(self, source, text):
+        # runs on the UI thread before anything is sent or saved
+        try:
+            matches = self.risk_detector.scan(text)
+            if matches:
+                self.on_risk_detected(source, matches)
+            return matches
+        except Exception as e:
+            print(f"[HushApp] check_risk error: {e}")
+            return []
+
+    def on_risk_detected(self, source, matches):
+        level = "high" if any(m.level == "high" for m in matches) else "moderate"
+        print(f"[HushApp] Risk phrases in {source}: {level} ({len(matches)} match(es))")
+        last_level, last_time = self.last_risk_alert
+        if (last_level is not None and RISK_LEVELS.index(level) <= RISK_LEVELS.index(last_level)
+                and time.time() - last_time < self.RISK_DIALOG_COOLDOWN):
+            return
+        self.last_risk_alert = (level, time.time())
+        try:
+            if self.risk_dialog:
+                self.risk_dialog.dismiss()
+            self.risk_dialog = MDDialog(
+                title="You don't have to go through this alone",
+                text=(
+                    "It sounds like things are really hard right now. If you're thinking about hurting yourself "
+                    "or might be in danger, please reach out now: call or text 988 (US), contact your local "
+                    "emergency number, or talk to someone you trust."
+                ),
+                buttons=[
+                    MDRaisedButton(
+                        text="OKAY",
+                        theme_text_color="Custom",
+                        text_color=self.theme_cls.primary_color,
+                        on_release=lambda x: self.risk_dialog.dismiss(),
+                    ),
+                ],
+            )
+            self.risk_dialog.open()
+        except Exception as e:
+            print(f"[HushApp] on_risk_detected error: {e}")
+
     def dismiss_dialog(self, obj):
        try:
          if self.dialog:
@@ -1402,6 +1493,35 @@ class HushApp(MDApp):
        except Exception:
          return True
 
+    def data_transfer(self):
+        jerry_ai = getattr(self, "jerry_ai", None)
+        return UserDataTransfer(
+            entries_log=getattr(self, "entries_log", None),
+            conversation_log=jerry_ai.conversation_log if jerry_ai else None,
+            memory=jerry_ai.memory if jerry_ai else None,
+            companion=jerry_ai.companion if jerry_ai else None,
+        )
+
+    def export_user_data(self, path, progress=None, on_done=None):
+        transfer = self.data_transfer()
+        transfer.run_async(transfer.export_to, path, progress, on_done)
+
+    def import_user_data(self, path, progress=None, on_done=None):
+        transfer = self.data_transfer()
+        transfer.run_async(transfer.import_from, path, progress, on_done)
+
+    def mood_analytics(self):
+        # None when numpy isn't bundled or the entries store isn't open yet
+        if np is None or not getattr(self, "entries_log", None):
+            return None
+        return MoodAnalytics.from_entries_log(self.entries_log)
+
+    def search(self, query, limit=20, kind=None):
+        # full-text search across journal entries and past conversations
+        if not getattr(self, "search_index", None):
+            return []
+        return self.search_index.search(query, limit=limit, kind=kind)
+
     def change_screen(self, screen_name: str):
         sm = self.root.ids.sm  # grab your ScreenManager
 
@@ -1433,6 +1553,9 @@ class HushApp(MDApp):
 
 # --- Main Entry Point ---
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--benchmark-risk"]:
+        print(RiskDetector.benchmark())
+        sys.exit(0)
     if not os.path.exists(ASSETS_PATH):
         print("Assets folder not found!")
     HushApp().run()
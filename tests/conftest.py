@@ -0,0 +1,6 @@
+import os
+import sys
+
+# hush_core uses Kivy's Clock when Kivy is installed; keep Kivy from parsing pytest's options
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
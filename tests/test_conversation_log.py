@@ -0,0 +1,55 @@
+import json
+from datetime import datetime, timedelta
+
+from hush_core import ConversationLog, persistence_writer
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+def session(timestamp, text="hello"):
+    return {"timestamp": timestamp, "conversation": [{"role": "user", "content": text}]}
+
+def make_log(tmp_path):
+    log = ConversationLog(str(tmp_path / "conversation_log.json"))
+    persistence_writer.flush()
+    return log
+
+def test_active_segment_rolls_over_by_age(tmp_path):
+    log = make_log(tmp_path)
+    log._write_session(session(days_ago(ConversationLog.SEGMENT_MAX_DAYS + 1), "old"))
+    log._write_session(session(days_ago(1), "recent"))
+    log._write_session(session(days_ago(0), "today"))
+
+    assert len(log.manifest["segments"]) == 2
+    assert [s["conversation"][0]["content"] for s in log.iter_sessions()] == ["today", "recent", "old"]
+
+def test_old_active_segment_is_archived(tmp_path):
+    log = make_log(tmp_path)
+    for days in (40, 38, 36):
+        log._write_session(session(days_ago(days), f"{days} days ago"))
+    assert len(log.manifest["segments"]) == 1
+
+    assert log.archive_old_sessions() == 3
+    assert log.manifest["segments"] == []
+    assert log.manifest["archive"][0]["count"] == 3
+
+    log._write_session(session(days_ago(0), "today"))
+    assert len(log.manifest["segments"]) == 1
+    assert [s["conversation"][0]["content"] for s in log.iter_sessions_chronological()] == [
+        "40 days ago", "38 days ago", "36 days ago", "today"]
+
+def test_empty_active_segment_is_kept(tmp_path):
+    log = make_log(tmp_path)
+    log._active_segment()
+
+    assert log.archive_old_sessions() == 0
+    assert len(log.manifest["segments"]) == 1
+
+def test_migrated_log_is_split_by_age_and_archived(tmp_path):
+    legacy = [session(days_ago(days), f"{days} days ago") for days in (1, 40, 50, 60)]  # newest first
+    (tmp_path / "conversation_log.json").write_text(json.dumps(legacy))
+    log = make_log(tmp_path)
+
+    assert sum(block["count"] for block in log.manifest["archive"]) == 3
+    assert [s["conversation"][0]["content"] for s in log.iter_sessions()] == [
+        "1 days ago", "40 days ago", "50 days ago", "60 days ago"]
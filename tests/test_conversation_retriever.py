@@ -0,0 +1,56 @@
+import json
+
+from hush_core import ConversationLog, ConversationRetriever, persistence_writer
+
+LEGACY_SESSIONS = [
+    {"timestamp": "2026-10-02 09:00:00", "conversation": [
+        {"role": "user", "content": "My sister keeps cancelling our plans"},
+        {"role": "assistant", "content": "That sounds disappointing."},
+    ]},
+    {"timestamp": "2026-10-01 21:00:00", "conversation": [
+        {"role": "user", "content": "I slept badly again"},
+        {"role": "assistant", "content": "Rest can be hard to find."},
+    ]},
+]
+
+def open_stores(tmp_path):
+    retriever = ConversationRetriever(str(tmp_path / "conversation_retrieval.db"))
+    log = ConversationLog(str(tmp_path / "conversation_log.json"), retriever=retriever)
+    persistence_writer.flush()
+    return retriever, log
+
+def test_stale_retriever_is_rebuilt_after_restart(tmp_path):
+    (tmp_path / "conversation_log.json").write_text(json.dumps(LEGACY_SESSIONS))
+    retriever, log = open_stores(tmp_path)
+    assert retriever.needs_rebuild
+    retriever.conn.close()  # the app closes before Jerry retrieved anything
+
+    retriever, log = open_stores(tmp_path)
+    assert retriever.needs_rebuild
+    retriever.rebuild()
+    assert [hit["text"] for hit in retriever.retrieve("sister cancelling plans")] == [
+        "You: My sister keeps cancelling our plans / Jerry: That sounds disappointing."
+    ]
+    retriever.conn.close()
+
+    retriever, log = open_stores(tmp_path)
+    assert not retriever.needs_rebuild
+    assert len(retriever.retrieve("sister")) == 1
+    retriever.conn.close()
+
+def test_interrupted_rebuild_stays_stale(tmp_path):
+    (tmp_path / "conversation_log.json").write_text(json.dumps(LEGACY_SESSIONS))
+    retriever, log = open_stores(tmp_path)
+
+    def failing_source():
+        yield LEGACY_SESSIONS[0]
+        raise OSError("killed mid-rebuild")
+
+    retriever.register_source(failing_source)
+    retriever.rebuild()
+    assert retriever.needs_rebuild
+    retriever.conn.close()
+
+    retriever, log = open_stores(tmp_path)
+    assert retriever.needs_rebuild
+    retriever.conn.close()
@@ -0,0 +1,61 @@
+import threading
+
+from hush_core import JerryAI, persistence_writer
+from tools.chat_bench import ScriptedBackend
+
+class RemoteScriptedBackend(ScriptedBackend):
+    remote = True  # so JerryAI caches and summarises through it
+
+def make_jerry(tmp_path, backend, **kwargs):
+    app = type("TestApp", (), {"user_data_dir": str(tmp_path)})()
+    return JerryAI(None, app, str(tmp_path / "conversation_log.json"), str(tmp_path / "jerry_memory.json"),
+                   backend=backend, **kwargs)
+
+def say(jerry, text):
+    answered, replies = threading.Event(), []
+    jerry.get_response_thread(text, lambda reply: (replies.append(reply), answered.set()))
+    assert answered.wait(5)
+    return replies[0]
+
+def test_greeting_hits_the_cache_across_sessions(tmp_path):
+    backend = RemoteScriptedBackend(replies=["Hello again!"])
+    jerry = make_jerry(tmp_path, backend)
+    for session in range(3):
+        say(jerry, "hi")
+        say(jerry, f"work was long today, part {session}")
+        jerry.end_session()
+        persistence_writer.flush()
+
+    stats = jerry.response_cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 4  # one lookup per uncached turn
+    assert len(backend.calls) == 4
+
+def test_summaries_fold_in_chunks(tmp_path):
+    backend = RemoteScriptedBackend(replies=["That sounds like a lot to carry; tell me more about how it felt."])
+    jerry = make_jerry(tmp_path, backend)
+    for turn in range(80):
+        say(jerry, f"Turn {turn}: today I kept thinking about the move and the new job and my sister.")
+        persistence_writer.flush()
+        while jerry.summary_running:
+            threading.Event().wait(0.01)
+
+    summary_calls = [m for m in backend.calls if m[0]["content"].startswith("Update the running notes")]
+    assert jerry.summarized_count > 0
+    assert len(summary_calls) <= 80 // 8  # each call folds several turns, not one per turn
+
+def test_cancelled_turn_leaves_no_user_message(tmp_path):
+    backend = RemoteScriptedBackend(replies=["I'm listening."], latency=0.3)
+    jerry = make_jerry(tmp_path, backend)
+    jerry.get_response_thread("this one gets cancelled", lambda reply: None)
+    while not backend.calls:
+        threading.Event().wait(0.01)
+    jerry.cancel_pending()
+    while jerry.pending_turns:
+        threading.Event().wait(0.01)
+    assert jerry.chat_history == []
+
+    say(jerry, "hello again")
+    roles = [m["role"] for m in backend.calls[-1] if m["role"] != "system"]
+    assert roles == ["user"]
+    assert [m["role"] for m in jerry.chat_history] == ["user", "assistant"]
@@ -0,0 +1,64 @@
+import json
+
+from hush_core import EntriesLog, SearchIndex
+
+LEGACY_ENTRIES = [
+    {"timestamp": "2026-10-02 09:00:00", "type": "journal", "data": {"text": "Argued with my boss again"}},
+    {"timestamp": "2026-10-01 21:00:00", "type": "journal", "data": {"text": "Quiet evening walk"}},
+]
+
+def open_stores(tmp_path):
+    index = SearchIndex(str(tmp_path / "search_index.db"))
+    entries = EntriesLog(str(tmp_path / "entries.json"), search_index=index)
+    return index, entries
+
+def close_stores(index, entries):
+    entries.close()
+    index.conn.close()
+
+def test_stale_index_is_rebuilt_after_restart(tmp_path):
+    (tmp_path / "entries.json").write_text(json.dumps(LEGACY_ENTRIES))
+    index, entries = open_stores(tmp_path)
+    assert index.needs_rebuild
+    close_stores(index, entries)  # the app closes before anything searched
+
+    index, entries = open_stores(tmp_path)
+    assert index.needs_rebuild
+    index.rebuild()
+    assert [hit["snippet"] for hit in index.search("boss")] == ["Argued with my boss again"]
+    close_stores(index, entries)
+
+    index, entries = open_stores(tmp_path)
+    assert not index.needs_rebuild
+    assert len(index.search("boss")) == 1
+    close_stores(index, entries)
+
+def test_interrupted_rebuild_stays_stale(tmp_path):
+    (tmp_path / "entries.json").write_text(json.dumps(LEGACY_ENTRIES))
+    index, entries = open_stores(tmp_path)
+
+    def failing_source():
+        yield 1, "2026-10-02 09:00:00", "Argued with my boss again"
+        raise OSError("killed mid-rebuild")
+
+    index.register_source("entry", failing_source)
+    index.rebuild()
+    assert index.needs_rebuild
+    close_stores(index, entries)
+
+    index, entries = open_stores(tmp_path)
+    assert index.needs_rebuild
+
+def test_mark_stale_during_rebuild_keeps_marker(tmp_path):
+    index, entries = open_stores(tmp_path)
+    index.rebuild()
+    assert not index.needs_rebuild
+
+    def source():
+        index.mark_stale()  # e.g. an import rewrote the sources meanwhile
+        yield 1, "2026-10-02 09:00:00", "Argued with my boss again"
+
+    index.register_source("entry", source)
+    index.rebuild()
+    assert index.needs_rebuild
+    close_stores(index, entries)
@@ -0,0 +1,64 @@
+import sqlite3
+
+from hush_core import ConversationLog, EntriesLog, UserDataTransfer, persistence_writer
+
+def make_transfer(tmp_path):
+    entries = EntriesLog(str(tmp_path / "entries.json"))
+    conversations = ConversationLog(str(tmp_path / "conversation_log.json"))
+    return UserDataTransfer(entries_log=entries, conversation_log=conversations)
+
+def test_reimporting_an_export_adds_nothing(tmp_path):
+    transfer = make_transfer(tmp_path)
+    for i in range(10):
+        transfer.entries_log.add_entry("journal", {"text": f"note {i}"})
+    transfer.conversation_log.add_session([{"role": "user", "content": "hello"}])
+    persistence_writer.flush()
+    export = str(tmp_path / "export.ndjson")
+    transfer.export_to(export)
+
+    first = transfer.import_from(export)
+    second = transfer.import_from(export)
+
+    assert transfer.entries_log.count_entries() == 10
+    assert transfer.entries_log.get_rollup("all", "type:journal")[0] == 10
+    assert len(list(transfer.conversation_log.iter_sessions_chronological())) == 1
+    assert (first["entries_imported"], first["entries_skipped"]) == (0, 10)
+    assert (second["sessions_imported"], second["sessions_skipped"]) == (0, 1)
+
+def test_import_into_empty_stores_then_again(tmp_path):
+    (tmp_path / "source").mkdir()
+    source = make_transfer(tmp_path / "source")
+    source.entries_log.import_entries([
+        {"timestamp": "2026-10-01 09:00:00", "type": "checkin", "data": {"emotion": "Good"}},
+        {"timestamp": "2026-10-02 09:00:00", "type": "journal", "data": {"text": "hi", "tags": ["a"]}},
+    ])
+    export = str(tmp_path / "export.ndjson")
+    source.export_to(export)
+
+    (tmp_path / "target").mkdir()
+    target = make_transfer(tmp_path / "target")
+    first = target.import_from(export)
+    second = target.import_from(export)
+
+    assert (first["entries_imported"], first["entries_skipped"]) == (2, 0)
+    assert (second["entries_imported"], second["entries_skipped"]) == (0, 2)
+    assert target.entries_log.count_entries() == 2
+
+def test_upgrade_drops_duplicates_from_earlier_imports(tmp_path):
+    db_path = tmp_path / "entries.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE entries (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, "
+        "type TEXT NOT NULL, data TEXT NOT NULL)"
+    )
+    rows = [("2026-10-01 09:00:00", "journal", '{"text": "twice", "mood": 3}'),
+            ("2026-10-01 09:00:00", "journal", '{"mood": 3, "text": "twice"}'),
+            ("2026-10-01 10:00:00", "journal", '{"text": "once"}')]
+    conn.executemany("INSERT INTO entries (timestamp, type, data) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+    entries = EntriesLog(str(tmp_path / "entries.json"))
+
+    assert entries.count_entries() == 2
+    assert entries.get_rollup("all", "type:journal")[0] == 2
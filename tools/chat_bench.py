@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+chat_bench.py — Jerry chat turn latency harness (development only; not part of the app)
+
+Drives turns through JerryAI.get_response_thread against a local
+OpenAI-compatible stub server, a running server (--base-url) or a scripted
+backend, and prints latency percentiles and throughput as JSON.
+
+    python tools/chat_bench.py --turns 200 --stream --warm
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# hush_core uses Kivy's Clock when Kivy is installed, and importing Kivy would
+# otherwise parse (and reject) our options
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hush_core import (
+    AsyncChatClient, ChatBackend, ChatStream, JerryAI, make_chat_backend, percentile, persistence_writer,
+)
+
+class ScriptedBackend(ChatBackend):
+    # Deterministic replies with simulated latency, streaming and failures, for
+    # exercising the chat path without a network. replies are used in turn;
+    # every request's messages are kept in calls.
+    name = "scripted"
+
+    def __init__(self, replies=None, latency=0.0, chunk_delay=0.0, error_rate=0.0, seed=None, workers=4):
+        super().__init__()
+        self.replies = list(replies or ["I'm here with you."])
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = []
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ScriptedBackend")
+
+    def _reply(self, messages, on_delta):
+        with self.lock:
+            reply = self.replies[len(self.calls) % len(self.replies)]
+            self.calls.append(messages)
+            failed = self.random.random() < self.error_rate
+        time.sleep(self.latency)
+        if failed:
+            raise RuntimeError("scripted backend failure")
+        if on_delta:
+            for i, word in enumerate(reply.split(" ")):
+                time.sleep(self.chunk_delay)
+                on_delta(word if i == 0 else " " + word)
+        return reply
+
+    def submit(self, messages, callback=None, timeout=None, on_delta=None):
+        return self._track(self.executor.submit(self._reply, list(messages), on_delta), callback)
+
+    def probe(self, timeout=5.0):
+        return self.executor.submit(lambda: self.random.random() >= self.error_rate)
+
+    def close(self):
+        super().close()
+        self.executor.shutdown(wait=False)
+
+class StubChatServer:
+    # Local OpenAI-compatible /v1/chat/completions endpoint for load tests and
+    # offline development. Simulates latency (plus jitter and an occasional
+    # slow tail), SSE streaming with a delay between chunks, and a fraction of
+    # failed requests.
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, chunk_delay=0.01,
+                 error_rate=0.0, error_status=500, reply="I'm here to listen. Tell me more about that.",
+                 tail_rate=0.0, tail_latency=2.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply = reply
+        self.random = random.Random()
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="StubChatServer", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                with stub.lock:
+                    failed = stub.random.random() < stub.error_rate
+                if failed:
+                    self._send_json(stub.error_status, {"error": {"message": "simulated failure"}})
+                elif self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": AsyncChatClient.MODEL, "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                with stub.lock:
+                    stub.requests += 1
+                    failed = stub.random.random() < stub.error_rate
+                    delay = max(0.0, stub.latency + stub.random.uniform(-stub.jitter, stub.jitter))
+                    if stub.random.random() < stub.tail_rate:
+                        delay = stub.tail_latency
+                    if failed:
+                        stub.errors += 1
+                time.sleep(delay)
+                if failed:
+                    self._send_json(stub.error_status, {"error": {"message": "simulated failure"}})
+                    return
+                if not request.get("stream"):
+                    self._send_json(200, {
+                        "object": "chat.completion",
+                        "model": request.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": stub.reply},
+                                     "finish_reason": "stop"}],
+                    })
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, word in enumerate(stub.reply.split(" ")):
+                        if i:
+                            time.sleep(stub.chunk_delay)
+                        chunk = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # client cancelled mid-stream
+
+        return Handler
+
+def benchmark_chat(turns=200, concurrency=1, stream=False, backend=None, base_url=None, latency=0.05,
+                   jitter=0.0, chunk_delay=0.005, error_rate=0.0, tail_rate=0.0, tail_latency=2.0, warm=False):
+    """Turn latency (ms) and throughput through JerryAI.get_response_thread -> callback.
+
+    Without a backend or base_url a StubChatServer is started and talked to over
+    HTTP. The UI hop is made direct, so the numbers exclude the Kivy frame wait.
+    """
+    server = None
+    if backend is None:
+        if base_url is None:
+            server = StubChatServer(latency=latency, jitter=jitter, chunk_delay=chunk_delay, error_rate=error_rate,
+                                    tail_rate=tail_rate, tail_latency=tail_latency)
+            base_url = server.start()
+        backend = make_chat_backend("openai", api_key="benchmark", base_url=base_url)
+    workdir = tempfile.mkdtemp(prefix="hush_benchmark_")
+    app = type("BenchmarkApp", (), {"user_data_dir": workdir})()
+    jerry_ai = JerryAI(None, app, os.path.join(workdir, "conversation_log.json"),
+                       os.path.join(workdir, "jerry_memory.json"), api_key="benchmark", backend=backend)
+    jerry_ai.run_on_ui = lambda fn: fn()
+    if warm:
+        warming = jerry_ai.warm_up()
+        if warming is not None:
+            warming.result()
+    timings, failures = [], []
+    counter = iter(range(turns))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                turn = next(counter, None)
+            if turn is None:
+                return
+            done = threading.Event()
+            started = time.perf_counter()
+            jerry_ai.get_response_thread(
+                f"Benchmark turn {turn}: today felt long and I want to talk it through.",
+                lambda response: done.set(),
+                stream=ChatStream() if stream else None,
+            )
+            if done.wait(backend.timeout if hasattr(backend, "timeout") else 30.0):
+                timings.append((time.perf_counter() - started) * 1000)
+            else:
+                failures.append(turn)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    timings.sort()
+    result = {
+        "backend": backend.name,
+        "turns": len(timings),
+        "timeouts": len(failures),
+        "concurrency": concurrency,
+        "stream": stream,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+        "max_ms": round(timings[-1], 2) if timings else 0.0,
+        "throughput_per_s": round(len(timings) / wall, 2) if wall else 0.0,
+        "turn_latency": jerry_ai.latency_report(),
+    }
+    if hasattr(jerry_ai.backend, "stats"):
+        result["resilience"] = jerry_ai.backend.stats()
+    if server:
+        result.update(server_requests=server.requests, server_errors=server.errors, connections=server.connections)
+    jerry_ai.shutdown()
+    persistence_writer.flush()
+    if server:
+        server.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def benchmark_chat_cli(argv):
+    parser = argparse.ArgumentParser(prog="tools/chat_bench.py", description="Jerry chat turn latency harness")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--base-url", help="benchmark a running OpenAI-compatible server instead of the stub")
+    parser.add_argument("--backend", choices=["openai", "fallback", "scripted"], help="benchmark a local backend")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server seconds before replying")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of stub replies that take --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--warm", action="store_true", help="warm the connection before the first turn")
+    args = parser.parse_args(argv)
+    backend = None
+    if args.backend == "scripted":
+        backend = ScriptedBackend(latency=args.latency, chunk_delay=args.chunk_delay, error_rate=args.error_rate)
+    elif args.backend and not (args.backend == "openai" and args.base_url is None):
+        backend = make_chat_backend(args.backend, api_key=os.environ.get("HUSHOS_API_KEY"), base_url=args.base_url)
+    return benchmark_chat(
+        turns=args.turns, concurrency=args.concurrency, stream=args.stream, backend=backend,
+        base_url=args.base_url, latency=args.latency, jitter=args.jitter, chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate, tail_rate=args.tail_rate, tail_latency=args.tail_latency, warm=args.warm,
+    )
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_chat_cli(sys.argv[1:]), indent=2))
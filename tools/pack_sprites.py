@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+pack_sprites.py — builds assets/jerry_sprites.bin from tools/jerry_sprites.txt (development only)
+
+Edit the frames in the text source, then run
+
+    python tools/pack_sprites.py
+
+and commit both files. --check exits non-zero if the packed sheet is out of
+date with the source instead of writing it.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+
+# hush_core uses Kivy's Clock when Kivy is installed, and importing Kivy would
+# otherwise parse (and reject) our options
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from hush_core import SpriteSheet
+
+SOURCE_PATH = os.path.join(TOOLS_DIR, "jerry_sprites.txt")
+OUTPUT_PATH = os.path.join(REPO_DIR, SpriteSheet.PATH)  # SpriteSheet.PATH is relative to the app directory
+
+def parse_sprites(path):
+    """Read a frame source file into {state: [frame rows, ...]} for SpriteSheet.pack."""
+    frames, states, current = {}, {}, None
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                current = None
+                continue
+            keyword, _, rest = line.partition(" ")
+            if keyword == "frame":
+                current = frames.setdefault(rest.strip(), [])
+            elif keyword == "state":
+                name, _, sequence = rest.partition("=")
+                missing = [frame for frame in sequence.split() if frame not in frames]
+                if missing or not sequence.split():
+                    raise ValueError(f"{path}:{number}: unknown or missing frames {missing}")
+                states[name.strip()] = [frames[frame] for frame in sequence.split()]
+            elif current is not None:
+                current.append([0 if pixel == "." else int(pixel) for pixel in line])
+            else:
+                raise ValueError(f"{path}:{number}: pixel row outside a frame")
+    # (rows, width) of every row of every frame: one pair means all frames match
+    sizes = {(len(rows), len(row)) for rows in frames.values() for row in rows}
+    if len(sizes) != 1 or not all(frames.values()):
+        raise ValueError(f"{path}: frames differ in size: {sorted(sizes)}")
+    if not states:
+        raise ValueError(f"{path}: no states")
+    return states
+
+def pack_sprites(source=SOURCE_PATH, output=OUTPUT_PATH, check=False):
+    states = parse_sprites(source)
+    if not check:
+        SpriteSheet.pack(output, states)
+        return True
+    fd, scratch = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    try:
+        SpriteSheet.pack(scratch, states)
+        with open(scratch, "rb") as fresh, open(output, "rb") as packed:
+            return fresh.read() == packed.read()
+    except FileNotFoundError:
+        return False
+    finally:
+        os.remove(scratch)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack Jerry's sprite frames into a sprite sheet.")
+    parser.add_argument("--source", default=SOURCE_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--check", action="store_true", help="only report whether the output is up to date")
+    args = parser.parse_args()
+    up_to_date = pack_sprites(args.source, args.output, check=args.check)
+    if args.check and not up_to_date:
+        print(f"{args.output} is out of date; run tools/pack_sprites.py")
+        sys.exit(1)
+    if not args.check:
+        print(f"wrote {args.output}")